@@ -7,80 +7,208 @@ Tkinter GUI that connects to headless Raspberry Pi server.
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 import socket
+import selectors
 import json
 import threading
-import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# One shared codec: compact separators, built once instead of per message
+_json_encoder = json.JSONEncoder(separators=(',', ':'))
+_json_decoder = json.JSONDecoder()
+
+
+# Pushed messages start with a fixed-width version, e.g. b'V0000000017 {...}\n'
+PUSH_HEADER_SIZE = 12
+
+
+def encode_message(command):
+    """Every message is one compact JSON object terminated by a newline"""
+    return _json_encoder.encode(command).encode('utf-8') + b'\n'
+
+
+def decode_message(data):
+    """Decode one message body (without the newline)"""
+    return _json_decoder.decode(str(data, 'utf-8'))
+
+
+# Pre-encoded messages for commands that never carry arguments
+GET_STATE_DELTA_MSG = encode_message({'cmd': 'get_state_delta'})
+GET_CATALOG_MSG = encode_message({'cmd': 'get_catalog'})
+DETECT_TAG_MSG = encode_message({'cmd': 'detect_tag'})
+WRITE_TAG_MSG = encode_message({'cmd': 'write_tag'})
+
 
 class AmiiboClient:
     """Network client for Amiibo server"""
     
-    def __init__(self, host, port=5555):
+    def __init__(self, host, port=5555, timeout=5.0):
         self.host = host
         self.port = port
+        self.timeout = timeout
         self.connected = False
+        self.sock = None
+        self.lock = threading.Lock()
+        # Receive buffer reused for every response; _rxlen bytes of it are unparsed
+        self._rxbuf = bytearray(65536)
+        self._rxview = memoryview(self._rxbuf)
+        self._rxlen = 0
+        self._scanned = 0  # Prefix of the unparsed bytes known to hold no newline
+    
+    def _open_socket(self):
+        """Open a keep-alive connection to the server"""
+        sock = socket.create_connection((self.host, self.port), timeout=5)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self.timeout)
+        return sock
+    
+    def _close_socket(self):
+        """Close the persistent socket if open"""
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+        # Leftover bytes belong to the old connection
+        self._rxlen = 0
+        self._scanned = 0
+    
+    def _grow_rxbuf(self):
+        """Double the receive buffer for responses larger than it"""
+        self._rxview.release()
+        self._rxbuf.extend(bytes(len(self._rxbuf)))
+        self._rxview = memoryview(self._rxbuf)
     
     def connect(self):
-        """Test connection to server"""
-        try:
-            test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            test_socket.settimeout(5)
-            test_socket.connect((self.host, self.port))
-            test_socket.close()
-            self.connected = True
-            return True
-        except Exception as e:
-            self.connected = False
-            raise Exception(f"Connection failed: {e}")
+        """Open persistent connection to server"""
+        with self.lock:
+            self._close_socket()
+            try:
+                self.sock = self._open_socket()
+                self.connected = True
+                return True
+            except Exception as e:
+                self.connected = False
+                raise Exception(f"Connection failed: {e}")
+    
+    def _recv_some(self):
+        """Receive whatever is available into the buffer"""
+        if self._rxlen == len(self._rxbuf):
+            self._grow_rxbuf()
+        n = self.sock.recv_into(self._rxview[self._rxlen:])
+        if not n:
+            raise ConnectionResetError("Server closed connection")
+        self._rxlen += n
+    
+    def _pop_line(self):
+        """Take one complete line (without newline) from the buffer, or return None"""
+        idx = self._rxbuf.find(b'\n', self._scanned, self._rxlen)
+        if idx < 0:
+            self._scanned = self._rxlen
+            return None
+        
+        # Move any bytes past the delimiter to the front for the next call
+        line = bytes(self._rxview[:idx])
+        rest = self._rxlen - idx - 1
+        if rest:
+            self._rxbuf[:rest] = self._rxbuf[idx + 1:self._rxlen]
+        self._rxlen = rest
+        self._scanned = 0
+        return line
+    
+    def _pop_message(self):
+        """Parse one complete message from the buffer, or return None"""
+        line = self._pop_line()
+        return None if line is None else decode_message(line)
+    
+    def _exchange(self, message):
+        """Send one message on the persistent socket and read one response"""
+        if self.sock is None:
+            self.sock = self._open_socket()
+        
+        self.sock.sendall(message)
+        
+        response = self._pop_message()
+        while response is None:
+            self._recv_some()
+            response = self._pop_message()
+        return response
+    
+    def subscribe(self, since=None):
+        """Switch this connection to server push; read pushes with receive_pushed()"""
+        with self.lock:
+            self._close_socket()
+            try:
+                self.sock = self._open_socket()
+                self.sock.sendall(encode_message({'cmd': 'subscribe', 'since': since}))
+                self.connected = True
+            except Exception as e:
+                self.connected = False
+                raise Exception(f"Subscribe failed: {e}")
+    
+    def receive_pushed(self):
+        """Read pushed messages once the socket is readable.
+        
+        Returns (version, body) pairs; bodies are left undecoded so callers
+        can skip unchanged versions without parsing them.
+        """
+        with self.lock:
+            try:
+                self._recv_some()
+                messages = []
+                line = self._pop_line()
+                while line is not None:
+                    messages.append((int(line[1:PUSH_HEADER_SIZE - 1]), line[PUSH_HEADER_SIZE:]))
+                    line = self._pop_line()
+                return messages
+            except Exception as e:
+                self._close_socket()
+                self.connected = False
+                raise Exception(f"Communication error: {e}")
     
     def send_command(self, command):
-        """Send command and get response (new connection each time)"""
+        """Send command (dict or pre-encoded bytes) and get response"""
         if not self.connected:
             raise Exception("Not connected to server")
         
-        sock = None
-        try:
-            # Create new connection for each command
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(5.0)
-            sock.connect((self.host, self.port))
-            
-            # Send command
-            message = json.dumps(command).encode('utf-8')
-            sock.sendall(message)
-            
-            # Read until newline delimiter
-            data = b''
-            while True:
-                chunk = sock.recv(4096)
-                if not chunk:
-                    break
-                data += chunk
+        message = command if isinstance(command, bytes) else encode_message(command)
+        
+        with self.lock:
+            try:
+                try:
+                    return self._exchange(message)
+                except socket.timeout:
+                    raise
+                except OSError:
+                    # Stale connection (server restart, idle drop) - reconnect once and retry
+                    self._close_socket()
+                    return self._exchange(message)
                 
-                # Check if we have complete message
-                if b'\n' in data:
-                    # Get first complete message
-                    lines = data.split(b'\n', 1)
-                    message_data = lines[0]
-                    
-                    # Parse JSON
-                    response = json.loads(message_data.decode('utf-8'))
-                    return response
-            
-            raise Exception("No response received")
-            
-        except socket.timeout:
-            raise Exception("Response timeout")
-        except json.JSONDecodeError as e:
-            raise Exception(f"JSON parse error: {e}")
-        except Exception as e:
-            raise Exception(f"Communication error: {e}")
-        finally:
-            if sock:
-                sock.close()
+            except socket.timeout:
+                # A late reply would desync the stream, so drop the connection
+                self._close_socket()
+                raise Exception("Response timeout")
+            except json.JSONDecodeError as e:
+                self._close_socket()
+                raise Exception(f"JSON parse error: {e}")
+            except Exception as e:
+                self._close_socket()
+                raise Exception(f"Communication error: {e}")
     
     def disconnect(self):
         """Disconnect from server"""
+        with self.lock:
+            self._close_socket()
         self.connected = False
+    
+    def __enter__(self):
+        self.connect()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.disconnect()
 
 
 class AmiiboGUI:
@@ -92,9 +220,23 @@ class AmiiboGUI:
         self.root.geometry("800x600")
         
         self.client = None
+        self.watcher = None  # Second connection the server pushes state on
         self.state = None
+        self._shown_categories = None  # Lists currently in the listboxes
+        self._shown_characters = None
+        self._last_cats = []  # Row labels currently in the listboxes
+        self._last_chars = []
+        self._diff_lock = threading.Lock()  # Orders diffs computed on different threads
+        self._pending_cat = None  # Debounced selection sends (root.after ids)
+        self._pending_char = None
+        self._log_buf = []  # Log lines waiting for the next flush
+        self._log_pending = False
         self.update_thread = None
         self.running = False
+        self._stop_evt = threading.Event()  # Wakes the update thread on shutdown
+        
+        # Single worker keeps network round trips off the Tk thread, in click order
+        self.executor = ThreadPoolExecutor(max_workers=1)
         
         self.create_widgets()
         self.show_connection_dialog()
@@ -253,134 +395,235 @@ class AmiiboGUI:
     def start_updates(self):
         """Start background update thread"""
         self.running = True
+        self._stop_evt.clear()
+        # Pushed updates arrive on their own connection, never the command socket
+        self.watcher = AmiiboClient(self.client.host, self.client.port, timeout=30.0)
         self.update_thread = threading.Thread(target=self.update_loop, daemon=True)
         self.update_thread.start()
     
     def update_loop(self):
-        """Background update loop"""
-        last_state_str = None
+        """Background update loop - sleeps until the server pushes a state change"""
+        last_version = None
+        selector = selectors.DefaultSelector()
         
         while self.running:
             try:
-                if self.client and self.client.connected:
-                    response = self.client.send_command({'cmd': 'get_state'})
-                    if response.get('success'):
-                        new_state = response.get('data')
-                        # Only update UI if state actually changed
-                        new_state_str = json.dumps(new_state, sort_keys=True)
-                        if new_state_str != last_state_str:
-                            self.state = new_state
-                            last_state_str = new_state_str
-                            self.root.after(0, self.update_ui)
+                if not self.watcher.connected:
+                    self.watcher.subscribe(last_version)
+                    selector.register(self.watcher.sock, selectors.EVENT_READ)
+                
+                # Server re-sends the state every 25 s, so silence means it is gone
+                if not selector.select(30):
+                    raise Exception("Server stopped sending updates")
+                
+                for version, body in self.watcher.receive_pushed():
+                    # Heartbeats repeat the same version - skip without decoding
+                    if version == last_version:
+                        continue
+                    message = decode_message(body)
+                    if message.get('success'):
+                        self._publish_state(self._merge_state(self.client, message.get('data')))
+                        last_version = version
             except Exception as e:
-                # Only log errors occasionally to avoid spam
-                pass
-            
-            time.sleep(1.0)  # Slower polling - 1 second instead of 0.5
+                # Server unreachable - drop the subscription and back off before retrying
+                for key in list(selector.get_map().values()):
+                    selector.unregister(key.fileobj)
+                self.watcher.disconnect()
+                if self._stop_evt.wait(1.0):
+                    break
     
-    def update_ui(self):
-        """Update UI with current state"""
-        if not self.state:
-            return
-        
-        # Update categories
-        categories = self.state.get('categories', [])
-        current_cat = self.state.get('current_category', 0)
-        
-        if len(categories) != self.category_listbox.size():
-            self.category_listbox.delete(0, tk.END)
-            for cat in categories:
-                self.category_listbox.insert(tk.END, cat.get('name', 'Unknown'))
-        
-        if current_cat < self.category_listbox.size():
-            self.category_listbox.selection_clear(0, tk.END)
-            self.category_listbox.selection_set(current_cat)
-            self.category_listbox.see(current_cat)
+    def _merge_state(self, client, live):
+        """Combine live fields with cached lists, refetching lists only when stale"""
+        old = self.state or {}
+        state = dict(old)
+        state.update(live)
+        
+        if 'categories' not in old or live.get('catalog_version') != old.get('catalog_version'):
+            response = client.send_command(GET_CATALOG_MSG)
+            state['categories'] = response.get('data', {}).get('categories', [])
+            state.pop('characters', None)
+        
+        if 'characters' not in state or live.get('current_category') != old.get('current_category'):
+            # Only the display name is needed - skip paths/metadata in the payload
+            response = client.send_command({
+                'cmd': 'get_characters',
+                'index': live.get('current_category', 0),
+                'fields': ['character']
+            })
+            state['characters'] = response.get('data', [])
+        
+        return state
+    
+    def _publish_state(self, state):
+        """Store a new state and post the widget changes it needs to the Tk thread"""
+        with self._diff_lock:
+            self.state = state
+            ops = self._diff_state(state)
+            if ops:
+                self.root.after(0, self._apply_ops, ops)
+    
+    def _diff_state(self, state):
+        """Work out widget changes for a state (runs off the Tk thread)"""
+        ops = []
+        
+        # Update categories (lists are only replaced when refetched)
+        categories = state.get('categories', [])
+        if categories is not self._shown_categories:
+            self._shown_categories = categories
+            names = [cat.get('name', 'Unknown') for cat in categories]
+            ops.extend(self._listbox_ops(self.category_listbox, self._last_cats, names))
+            self._last_cats = names
+        
+        current_cat = state.get('current_category', 0)
+        if current_cat < len(self._last_cats):
+            ops.append(('select', self.category_listbox, current_cat))
         
         # Update characters
-        characters = self.state.get('characters', [])
-        current_char = self.state.get('current_character', 0)
-        
-        self.character_listbox.delete(0, tk.END)
-        for char in characters:
+        characters = state.get('characters', [])
+        if characters is not self._shown_characters:
+            self._shown_characters = characters
             # Use 'character' key, fallback to 'name', then 'Unknown'
-            char_name = char.get('character', char.get('name', 'Unknown'))
-            self.character_listbox.insert(tk.END, char_name)
-        
-        if current_char < self.character_listbox.size():
-            self.character_listbox.selection_clear(0, tk.END)
-            self.character_listbox.selection_set(current_char)
-            self.character_listbox.see(current_char)
-        
-        # Update current Amiibo
-        amiibo = self.state.get('current_amiibo')
-        if amiibo:
-            self.amiibo_label.config(text=amiibo)
-            self.write_button.config(state=tk.NORMAL)
-        else:
-            self.amiibo_label.config(text="None")
-            self.write_button.config(state=tk.DISABLED)
+            names = [char.get('character', char.get('name', 'Unknown')) for char in characters]
+            ops.extend(self._listbox_ops(self.character_listbox, self._last_chars, names))
+            self._last_chars = names
+        
+        current_char = state.get('current_character', 0)
+        if current_char < len(self._last_chars):
+            ops.append(('select', self.character_listbox, current_char))
         
-        # Update progress
-        progress = self.state.get('write_progress', 0)
-        self.progress_bar['value'] = progress
+        # Update current Amiibo and progress
+        ops.append(('amiibo', state.get('current_amiibo')))
+        progress = state.get('write_progress', 0)
+        ops.append(('progress', progress))
         
         # Update status
-        status = self.state.get('status', 'idle')
+        status = state.get('status', 'idle')
         if status == 'writing':
-            self.log(f"Writing... {progress}%")
+            ops.append(('log', f"Writing... {progress}%"))
         elif status == 'write_complete':
-            self.log("✓ Write complete!")
+            ops.append(('log', "✓ Write complete!"))
         elif status == 'write_error':
-            self.log("✗ Write failed!")
+            ops.append(('log', "✗ Write failed!"))
+        
+        return ops
+    
+    def _listbox_ops(self, listbox, shown, names):
+        """Ops that update listbox rows, leaving the common prefix untouched"""
+        prefix = 0
+        limit = min(len(shown), len(names))
+        while prefix < limit and shown[prefix] == names[prefix]:
+            prefix += 1
+        
+        ops = []
+        if prefix < len(shown):
+            ops.append(('delete', listbox, prefix))
+        if prefix < len(names):
+            ops.append(('insert', listbox, names[prefix:]))
+        return ops
+    
+    def _apply_ops(self, ops):
+        """Apply precomputed widget changes - only cheap Tk calls on the main thread"""
+        for op, *args in ops:
+            if op == 'delete':
+                args[0].delete(args[1], tk.END)
+            elif op == 'insert':
+                args[0].insert(tk.END, *args[1])
+            elif op == 'select':
+                listbox, index = args
+                listbox.selection_clear(0, tk.END)
+                listbox.selection_set(index)
+                listbox.see(index)
+            elif op == 'amiibo':
+                if args[0]:
+                    self.amiibo_label.config(text=args[0])
+                    self.write_button.config(state=tk.NORMAL)
+                else:
+                    self.amiibo_label.config(text="None")
+                    self.write_button.config(state=tk.DISABLED)
+            elif op == 'progress':
+                self.progress_bar['value'] = args[0]
+            elif op == 'log':
+                self.log(args[0])
+    
+    def run_in_background(self, func, *args, on_done=None, on_error=None):
+        """Run func on the network worker; callbacks are run on the Tk thread"""
+        def finished(future):
+            error = future.exception()
+            if error is not None:
+                if on_error:
+                    self.root.after(0, on_error, error)
+            elif on_done:
+                self.root.after(0, on_done, future.result())
+        
+        future = self.executor.submit(func, *args)
+        future.add_done_callback(finished)
+        return future
     
     def refresh_state(self):
         """Manually refresh state"""
-        try:
-            response = self.client.send_command({'cmd': 'get_state'})
+        def fetch():
+            response = self.client.send_command(GET_STATE_DELTA_MSG)
             if response.get('success'):
-                self.state = response.get('data')
-                self.update_ui()
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to refresh: {e}")
+                self._publish_state(self._merge_state(self.client, response.get('data')))
+        
+        self.run_in_background(
+            fetch, on_error=lambda e: messagebox.showerror("Error", f"Failed to refresh: {e}")
+        )
     
     def on_category_select(self, event):
         """Handle category selection"""
         selection = self.category_listbox.curselection()
         if selection:
-            index = selection[0]
-            try:
-                response = self.client.send_command({
-                    'cmd': 'set_category',
-                    'index': index
-                })
-                if response.get('success'):
-                    self.log(f"Selected category: {index}")
-                    # Update will happen in background thread
-            except Exception as e:
-                self.log(f"Error: {e}")
+            # Coalesce rapid selection changes (e.g. arrow keys) into one send
+            if self._pending_cat:
+                self.root.after_cancel(self._pending_cat)
+            self._pending_cat = self.root.after(100, self._send_set_category, selection[0])
+    
+    def _send_set_category(self, index):
+        """Send the settled category selection"""
+        self._pending_cat = None
+        
+        def done(response):
+            if response.get('success'):
+                self.log(f"Selected category: {index}")
+                # Update will happen in background thread
+        
+        self.run_in_background(
+            self.client.send_command, {'cmd': 'set_category', 'index': index},
+            on_done=done, on_error=lambda e: self.log(f"Error: {e}")
+        )
     
     def on_character_select(self, event):
         """Handle character selection"""
         selection = self.character_listbox.curselection()
         if selection:
-            index = selection[0]
-            try:
-                # First set the character index
+            if self._pending_char:
+                self.root.after_cancel(self._pending_char)
+            self._pending_char = self.root.after(100, self._send_select_character, selection[0])
+    
+    def _send_select_character(self, index):
+        """Send the settled character selection and load it"""
+        self._pending_char = None
+        
+        def select():
+            # First set the character index
+            response = self.client.send_command({
+                'cmd': 'set_character',
+                'index': index
+            })
+            # Then load it
+            if response.get('success'):
                 response = self.client.send_command({
-                    'cmd': 'set_character',
+                    'cmd': 'select_character',
                     'index': index
                 })
-                # Then load it
-                if response.get('success'):
-                    response = self.client.send_command({
-                        'cmd': 'select_character',
-                        'index': index
-                    })
-                    if response.get('success'):
-                        self.log(f"Loaded character: {index}")
-            except Exception as e:
-                self.log(f"Error: {e}")
+            return response
+        
+        def done(response):
+            if response.get('success'):
+                self.log(f"Loaded character: {index}")
+        
+        self.run_in_background(select, on_done=done, on_error=lambda e: self.log(f"Error: {e}"))
     
     def write_tag(self):
         """Write to tag"""
@@ -394,34 +637,30 @@ class AmiiboGUI:
         )
         
         if result:
-            try:
-                self.log("Starting write...")
-                self.write_button.config(state=tk.DISABLED)
-                
-                # Send write command in background
-                def write_thread():
-                    try:
-                        response = self.client.send_command({'cmd': 'write_tag'})
-                        if response.get('success'):
-                            self.root.after(0, lambda: self.log("✓ Write successful!"))
-                        else:
-                            self.root.after(0, lambda: self.log("✗ Write failed!"))
-                    except Exception as e:
-                        self.root.after(0, lambda: self.log(f"✗ Error: {e}"))
-                    finally:
-                        self.root.after(0, lambda: self.write_button.config(state=tk.NORMAL))
-                
-                threading.Thread(target=write_thread, daemon=True).start()
-                
-            except Exception as e:
-                self.log(f"Error: {e}")
+            self.log("Starting write...")
+            self.write_button.config(state=tk.DISABLED)
+            
+            def done(response):
+                # The server writes in the background; progress and the result
+                # come through the pushed status
+                if response.get('success'):
+                    self.log("Write queued - keep the tag on the reader")
+                else:
+                    self.log("✗ Write failed!")
                 self.write_button.config(state=tk.NORMAL)
+            
+            def failed(e):
+                self.log(f"✗ Error: {e}")
+                self.write_button.config(state=tk.NORMAL)
+            
+            # Send write command in background
+            self.run_in_background(self.client.send_command, WRITE_TAG_MSG, on_done=done, on_error=failed)
     
     def detect_tag(self):
         """Detect if tag is present"""
-        try:
-            self.log("Detecting tag...")
-            response = self.client.send_command({'cmd': 'detect_tag'})
+        self.log("Detecting tag...")
+        
+        def done(response):
             if response.get('success'):
                 if response.get('detected'):
                     self.log("✓ Tag detected!")
@@ -429,20 +668,36 @@ class AmiiboGUI:
                 else:
                     self.log("✗ No tag detected")
                     messagebox.showwarning("Tag Detection", "No tag detected")
-        except Exception as e:
+        
+        def failed(e):
             self.log(f"Error: {e}")
             messagebox.showerror("Error", str(e))
+        
+        self.run_in_background(self.client.send_command, DETECT_TAG_MSG, on_done=done, on_error=failed)
     
     def log(self, message):
-        """Log message to status text"""
-        self.status_text.insert(tk.END, message + "\n")
+        """Queue message for the status text (flushed in batches)"""
+        self._log_buf.append(message + "\n")
+        if not self._log_pending:
+            self._log_pending = True
+            self.root.after(50, self._flush_log)
+    
+    def _flush_log(self):
+        """Write queued log lines with a single insert and scroll"""
+        self._log_pending = False
+        lines, self._log_buf = self._log_buf, []
+        self.status_text.insert(tk.END, ''.join(lines))
         self.status_text.see(tk.END)
     
     def on_closing(self):
         """Handle window closing"""
         self.running = False
+        self._stop_evt.set()
         if self.client:
             self.client.disconnect()
+        if self.watcher:
+            self.watcher.disconnect()
+        self.executor.shutdown(wait=False)
         self.root.destroy()
 
 
@@ -4,18 +4,66 @@ Configuration Module for Amiibo Emulator - Raspberry Pi Version
 Contains all configuration constants and settings for Raspberry Pi.
 """
 
+import os
+from typing import Final
+
+# Hot-path constants live at module level so importers bind them directly
+# (one global lookup instead of a class attribute lookup per use).
+# The config classes below alias them for existing callers.
+
+# I2C / PN532 hardware
+I2C_BUS: Final = 1  # I2C bus number (usually 1 on Raspberry Pi)
+PN532_I2C_ADDRESS: Final = 0x24  # Default I2C address for PN532
+PN532_T_I2C: Final = 0.005  # Seconds the PN532 needs to recover after NACKing a transfer
+PN532_NACK_RETRIES: Final = 3  # Attempts per transaction before giving up
+
+# PN532 frame bytes
+PN532_PREAMBLE: Final = 0x00
+PN532_STARTCODE1: Final = 0x00
+PN532_STARTCODE2: Final = 0xFF
+PN532_POSTAMBLE: Final = 0x00
+PN532_HOSTTOPN532: Final = 0xD4
+PN532_PN532TOHOST: Final = 0xD5
+
+# PN532 Commands
+COMMAND_DIAGNOSE: Final = 0x00
+COMMAND_GETFIRMWAREVERSION: Final = 0x02
+COMMAND_GETGENERALSTATUS: Final = 0x04
+COMMAND_SAMCONFIGURATION: Final = 0x14
+COMMAND_INLISTPASSIVETARGET: Final = 0x4A
+COMMAND_INDATAEXCHANGE: Final = 0x40
+COMMAND_INAUTOPOLL: Final = 0x60
+COMMAND_TGSETGENERALBYTES: Final = 0x64
+COMMAND_TGGETDATA: Final = 0x68
+COMMAND_TGSETDATA: Final = 0x6A
+COMMAND_TGINITASTARGET: Final = 0x8C
+COMMAND_TGSETMETADATA: Final = 0x94
+
+# NTAG215 Commands
+NTAG_CMD_READ: Final = 0x30
+NTAG_CMD_WRITE: Final = 0xA2
+NTAG_CMD_FAST_READ: Final = 0x3A  # Pages start..end (inclusive) in one reply
+
+# Complete frames for commands whose arguments never change
+# (00 00 FF LEN LCS D4 CMD DATA... DCS 00, LEN counting D4 + CMD + DATA)
+PN532_FRAME_FIRMWARE: Final = bytes([0x00, 0x00, 0xFF, 0x02, 0xFE, 0xD4, 0x02, 0x2A, 0x00])
+PN532_FRAME_SAM: Final = bytes([0x00, 0x00, 0xFF, 0x05, 0xFB, 0xD4, 0x14, 0x01, 0x14, 0x01, 0x02, 0x00])
+PN532_FRAME_DETECT: Final = bytes([0x00, 0x00, 0xFF, 0x04, 0xFC, 0xD4, 0x4A, 0x01, 0x00, 0xE1, 0x00])
+# InAutoPoll: poll forever, every 2 x 150 ms, generic passive 106 kbps type A
+PN532_FRAME_AUTOPOLL: Final = bytes([0x00, 0x00, 0xFF, 0x05, 0xFB, 0xD4, 0x60, 0xFF, 0x02, 0x00, 0xCB, 0x00])
+
 # Hardware Configuration
 class HardwareConfig:
     """Hardware pin and address configuration for Raspberry Pi"""
     
     # I2C Configuration 
-    I2C_BUS = 1  # I2C bus number (usually 1 on Raspberry Pi)
+    I2C_BUS = I2C_BUS
     I2C_FREQUENCY = 100000  # 100kHz
     
     # PN532 GPIO Pins (BCM numbering)
     PN532_IRQ_PIN = 16  # GPIO24 for interrupt
     PN532_RST_PIN = 17  # GPIO25 for reset
-    PN532_I2C_ADDRESS = 0x24  # Default I2C address for PN532
+    PN532_I2C_ADDRESS = PN532_I2C_ADDRESS
 
     
 # Application Configuration
@@ -69,17 +117,18 @@ class NFCConfig:
     """NFC protocol and communication settings"""
     
     # PN532 Commands
-    COMMAND_DIAGNOSE = 0x00
-    COMMAND_GETFIRMWAREVERSION = 0x02
-    COMMAND_GETGENERALSTATUS = 0x04
-    COMMAND_SAMCONFIGURATION = 0x14
-    COMMAND_INLISTPASSIVETARGET = 0x4A
-    COMMAND_INDATAEXCHANGE = 0x40
-    COMMAND_TGSETGENERALBYTES = 0x64
-    COMMAND_TGGETDATA = 0x68
-    COMMAND_TGSETDATA = 0x6A
-    COMMAND_TGINITASTARGET = 0x8C
-    COMMAND_TGSETMETADATA = 0x94
+    COMMAND_DIAGNOSE = COMMAND_DIAGNOSE
+    COMMAND_GETFIRMWAREVERSION = COMMAND_GETFIRMWAREVERSION
+    COMMAND_GETGENERALSTATUS = COMMAND_GETGENERALSTATUS
+    COMMAND_SAMCONFIGURATION = COMMAND_SAMCONFIGURATION
+    COMMAND_INLISTPASSIVETARGET = COMMAND_INLISTPASSIVETARGET
+    COMMAND_INDATAEXCHANGE = COMMAND_INDATAEXCHANGE
+    COMMAND_INAUTOPOLL = COMMAND_INAUTOPOLL
+    COMMAND_TGSETGENERALBYTES = COMMAND_TGSETGENERALBYTES
+    COMMAND_TGGETDATA = COMMAND_TGGETDATA
+    COMMAND_TGSETDATA = COMMAND_TGSETDATA
+    COMMAND_TGINITASTARGET = COMMAND_TGINITASTARGET
+    COMMAND_TGSETMETADATA = COMMAND_TGSETMETADATA
     
     # Mifare Commands
     MIFARE_CMD_AUTH_A = 0x60
@@ -148,6 +197,9 @@ class DebugConfig:
     WARNING = "WARNING"
     ERROR = "ERROR"
     
+    # Level for the logging module; override with AMIIBO_LOGLEVEL=DEBUG
+    LOG_LEVEL = os.environ.get('AMIIBO_LOGLEVEL', INFO).upper()
+    
     # Components to debug
     DEBUG_NFC = True
     DEBUG_UI = True
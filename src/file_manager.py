@@ -5,13 +5,61 @@ Handles Amiibo file organization, parsing, and categorization.
 """
 
 import os
+import re
+import stat
 import json
 import time
-from typing import List, Dict, Optional, Tuple
+import random
+import heapq
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+
+# Filename keywords that mark a special edition, matched in one pass
+_SPECIAL_RE = re.compile(r'Gold|Silver|Wedding|Anniversary|Special')
+
+# Category folder names -> display names
+_CATEGORY_MAP = {
+    'Super_Mario': 'Super Mario',
+    'Legend_of_Zelda': 'The Legend of Zelda',
+    'Super_Smash_Bros': 'Super Smash Bros',
+    'Animal_Crossing': 'Animal Crossing',
+    'Kirby': 'Kirby',
+    'Metroid': 'Metroid',
+    'Fire_Emblem': 'Fire Emblem',
+    'Splatoon': 'Splatoon',
+    'Pokemon': 'Pokémon',
+    'Yoshis_Wooly_World': "Yoshi's Woolly World",
+    'Box_boy_Amiibo': 'BoxBoy!',
+    'Chibi_Robo_Amiibo': 'Chibi-Robo!',
+    'Dark_Souls_Amiibo': 'Dark Souls',
+    'Detective_Pikachu_Amiibo': 'Detective Pikachu',
+    'Diablo_Amiibo': 'Diablo',
+    'Kellogs_Amiibo': 'Kellogg\'s',
+    'Mario_Sports_Superstars': 'Mario Sports Superstars',
+    'Mega_Man_Amiibo': 'Mega Man',
+    'Monster_Hunter': 'Monster Hunter',
+    'Pikmin_Amiibo': 'Pikmin',
+    'Pokken_Tournament': 'Pokkén Tournament',
+    'Power_Pros_Amiibo': 'Power Pros',
+    'PowerUpBands': 'PowerUp Bands',
+    'Shovel_Knight_Amiibo': 'Shovel Knight',
+    'Skylanders': 'Skylanders',
+    'XenoBlade Chronicles': 'Xenoblade Chronicles',
+    'Yu_Gi_Oh_Amiibo': 'Yu-Gi-Oh!'
+}
+
+# Character name fix-ups (the old identity mappings like 'Neon Pink' were no-ops)
+_NAME_REPLACEMENTS = {
+    'Wedding': 'Wedding Edition'
+}
 
 class FileManager:
     """Manages Amiibo files and metadata"""
     
+    PARSE_WORKERS = 8  # Threads used to stat files during a full scan
+    PARSE_PARALLEL_THRESHOLD = 64  # Smaller trees are scanned on the calling thread
+    
     def __init__(self, data_dir: str = "amiibo_data"):
         """
         Initialize File Manager
@@ -29,6 +77,7 @@ class FileManager:
         
         # Load or create index
         self.index = self._load_index()
+        self._build_lookups()
         
         # Character and series mappings
         self.character_map = self._load_character_map()
@@ -45,27 +94,81 @@ class FileManager:
         if os.path.exists(self.index_file):
             try:
                 with open(self.index_file, 'r') as f:
-                    return json.load(f)
+                    index = json.load(f)
+                
+                # Only directories whose mtime moved need rescanning
+                dir_mtimes = index.get('dir_mtimes')
+                if dir_mtimes and self.categories_dir in dir_mtimes:
+                    changed = self._changed_dirs(dir_mtimes)
+                    if not changed:
+                        return index
+                    return self._rescan_changed(index, changed)
+                print("Index has no directory timestamps - rebuilding")
             except Exception as e:
                 print(f"Error loading index: {e}")
         
         # Create new index
         return self._create_index()
     
+    def _changed_dirs(self, dir_mtimes: Dict) -> List[str]:
+        """Recorded directories whose mtime changed or which no longer exist"""
+        changed = []
+        for directory, mtime in dir_mtimes.items():
+            try:
+                if os.stat(directory).st_mtime_ns != mtime:
+                    changed.append(directory)
+            except OSError:
+                changed.append(directory)
+        return changed
+    
+    def _rescan_changed(self, old_index: Dict, changed_dirs: List[str]) -> Dict:
+        """Rebuild the index, rescanning only directories that changed"""
+        print(f"Rescanning {len(changed_dirs)} changed directories...")
+        
+        dir_mtimes = dict(old_index['dir_mtimes'])
+        known_dirs = set(dir_mtimes)
+        
+        # Group existing entries by directory, keeping their order
+        by_dir = {}
+        for file_info in old_index['files']:
+            by_dir.setdefault(os.path.dirname(file_info['path']), []).append(file_info)
+        
+        for directory in changed_dirs:
+            del dir_mtimes[directory]
+            by_dir.pop(directory, None)
+        
+        for directory in changed_dirs:
+            if not os.path.isdir(directory):
+                continue
+            # Direct files of the changed dir, plus any subdirs not seen before
+            for entry in self._iter_nfc(directory, dir_mtimes, known_dirs):
+                file_info = self._parse_file_info(entry, "Categories")
+                if file_info:
+                    by_dir.setdefault(os.path.dirname(entry.path), []).append(file_info)
+        
+        nfc_files = [file_info for files in by_dir.values() for file_info in files]
+        return self._build_index(nfc_files, dir_mtimes)
+    
     def _create_index(self) -> Dict:
         """Create a new index from .nfc files"""
         print("Creating new Amiibo index...")
         
+        # Scan for .nfc files
+        dir_mtimes = {}
+        nfc_files = self._scan_nfc_files(dir_mtimes)
+        
+        return self._build_index(nfc_files, dir_mtimes)
+    
+    def _build_index(self, nfc_files: Iterable[Dict], dir_mtimes: Dict) -> Dict:
+        """Group scanned files (consumed once, as they arrive) into categories and save the index"""
         index = {
             "version": "1.0",
             "last_updated": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
             "categories": [],
-            "files": []
+            "files": [],
+            "dir_mtimes": dir_mtimes
         }
         
-        # Scan for .nfc files
-        nfc_files = self._scan_nfc_files()
-        
         # Group by category
         categories = {}
         for file_info in nfc_files:
@@ -82,6 +185,10 @@ class FileManager:
             categories[category]['files'].append(file_info)
             index['files'].append(file_info)
         
+        # Store each category's files in display order
+        for category in categories.values():
+            category['files'].sort(key=itemgetter('character'))
+        
         # Convert categories to list
         index['categories'] = list(categories.values())
         
@@ -91,38 +198,59 @@ class FileManager:
         print(f"Index created with {len(index['categories'])} categories and {len(index['files'])} files")
         return index
     
-    def _scan_nfc_files(self) -> List[Dict]:
-        """Scan for .nfc files and extract metadata"""
-        files = []
-        
+    def _scan_nfc_files(self, dir_mtimes: Optional[Dict] = None) -> Iterator[Dict]:
+        """Scan for .nfc files and yield their metadata"""
         # Scan categories directory for .nfc files
         if os.path.exists(self.categories_dir):
-            files.extend(self._scan_directory(self.categories_dir, "Categories"))
-        
-        return files
+            yield from self._scan_directory(self.categories_dir, "Categories", dir_mtimes)
     
-    def _scan_directory(self, directory: str, source: str) -> List[Dict]:
-        """Scan a directory for .nfc files"""
-        files = []
-        
-        for root, dirs, filenames in os.walk(directory):
-            for filename in filenames:
-                if filename.lower().endswith('.nfc'):
-                    file_path = os.path.join(root, filename)
-                    file_info = self._parse_file_info(file_path, source)
-                    if file_info:
-                        files.append(file_info)
+    def _scan_directory(self, directory: str, source: str, dir_mtimes: Optional[Dict] = None) -> Iterator[Dict]:
+        """Scan a directory for .nfc files, yielding metadata as it is parsed"""
+        entries = list(self._iter_nfc(directory, dir_mtimes))
+        
+        # stat() per file blocks on the SD card, so overlap them on larger trees
+        if len(entries) < self.PARSE_PARALLEL_THRESHOLD:
+            results = (self._parse_file_info(entry, source) for entry in entries)
+            yield from filter(None, results)
+        else:
+            with ThreadPoolExecutor(max_workers=self.PARSE_WORKERS) as executor:
+                results = executor.map(lambda entry: self._parse_file_info(entry, source), entries)
+                yield from filter(None, results)
+    
+    def _iter_nfc(self, path: str, dir_mtimes: Optional[Dict] = None, skip_dirs=()):
+        """
+        Yield DirEntry objects for .nfc files under path (files first, like os.walk)
         
-        return files
+        Args:
+            path: Directory to scan
+            dir_mtimes: If given, filled with the mtime of every directory visited
+            skip_dirs: Subdirectories of path not to descend into
+        """
+        if dir_mtimes is not None:
+            # Stat before listing so a change made mid-scan shows up next load
+            dir_mtimes[path] = os.stat(path).st_mtime_ns
+        
+        subdirs = []
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith('.') and entry.path not in skip_dirs:
+                        subdirs.append(entry.path)
+                elif entry.name.lower().endswith('.nfc') and entry.is_file():
+                    yield entry
+        
+        for subdir in subdirs:
+            yield from self._iter_nfc(subdir, dir_mtimes)
     
-    def _parse_file_info(self, file_path: str, source: str) -> Optional[Dict]:
+    def _parse_file_info(self, entry: os.DirEntry, source: str) -> Optional[Dict]:
         """Parse file path to extract metadata"""
+        file_path = entry.path
         try:
             # Extract relative path
             rel_path = os.path.relpath(file_path, source)
             
             # Parse filename
-            filename = os.path.basename(file_path)
+            filename = entry.name
             name_parts = filename.replace('.nfc', '').split('_')
             
             # Determine category from directory structure
@@ -131,8 +259,8 @@ class FileManager:
             # Extract character name
             character = self._extract_character_name(filename)
             
-            # Get file size
-            size = os.path.getsize(file_path)
+            # One stat call for size and mtime
+            st = entry.stat()
             
             return {
                 'path': file_path,
@@ -142,9 +270,9 @@ class FileManager:
                 'character': character,
                 'series': self._get_series_from_category(category),
                 'source': source,
-                'size': size,
+                'size': st.st_size,
                 'special': self._is_special_edition(filename),
-                'last_modified': os.path.getmtime(file_path)
+                'last_modified': st.st_mtime
             }
             
         except Exception as e:
@@ -157,37 +285,7 @@ class FileManager:
         dir_name = os.path.basename(os.path.dirname(file_path))
         
         # Map directory names to categories
-        category_map = {
-            'Super_Mario': 'Super Mario',
-            'Legend_of_Zelda': 'The Legend of Zelda',
-            'Super_Smash_Bros': 'Super Smash Bros',
-            'Animal_Crossing': 'Animal Crossing',
-            'Kirby': 'Kirby',
-            'Metroid': 'Metroid',
-            'Fire_Emblem': 'Fire Emblem',
-            'Splatoon': 'Splatoon',
-            'Pokemon': 'Pokémon',
-            'Yoshis_Wooly_World': "Yoshi's Woolly World",
-            'Box_boy_Amiibo': 'BoxBoy!',
-            'Chibi_Robo_Amiibo': 'Chibi-Robo!',
-            'Dark_Souls_Amiibo': 'Dark Souls',
-            'Detective_Pikachu_Amiibo': 'Detective Pikachu',
-            'Diablo_Amiibo': 'Diablo',
-            'Kellogs_Amiibo': 'Kellogg\'s',
-            'Mario_Sports_Superstars': 'Mario Sports Superstars',
-            'Mega_Man_Amiibo': 'Mega Man',
-            'Monster_Hunter': 'Monster Hunter',
-            'Pikmin_Amiibo': 'Pikmin',
-            'Pokken_Tournament': 'Pokkén Tournament',
-            'Power_Pros_Amiibo': 'Power Pros',
-            'PowerUpBands': 'PowerUp Bands',
-            'Shovel_Knight_Amiibo': 'Shovel Knight',
-            'Skylanders': 'Skylanders',
-            'XenoBlade Chronicles': 'Xenoblade Chronicles',
-            'Yu_Gi_Oh_Amiibo': 'Yu-Gi-Oh!'
-        }
-        
-        return category_map.get(dir_name, dir_name.replace('_', ' '))
+        return _CATEGORY_MAP.get(dir_name, dir_name.replace('_', ' '))
     
     def _extract_character_name(self, filename: str) -> str:
         """Extract character name from filename"""
@@ -198,18 +296,9 @@ class FileManager:
         name = name.replace('_', ' ')
         
         # Handle special cases
-        special_cases = {
-            'Gold Mario': 'Gold Mario',
-            'Wedding': 'Wedding Edition',
-            'Side Order': 'Side Order',
-            'Neon Green': 'Neon Green',
-            'Neon Pink': 'Neon Pink',
-            'Lime Green': 'Lime Green',
-            'Neon Purple': 'Neon Purple'
-        }
-        
-        for old, new in special_cases.items():
-            name = name.replace(old, new)
+        for old, new in _NAME_REPLACEMENTS.items():
+            if old in name:
+                name = name.replace(old, new)
         
         return name
     
@@ -220,76 +309,79 @@ class FileManager:
     
     def _is_special_edition(self, filename: str) -> bool:
         """Check if file represents a special edition"""
-        special_keywords = ['Gold', 'Silver', 'Wedding', 'Anniversary', 'Special']
-        return any(keyword in filename for keyword in special_keywords)
+        return _SPECIAL_RE.search(filename) is not None
     
-    def _save_index(self, index: Dict):
-        """Save index to JSON file"""
+    def _save_index(self, index: Dict, debug_indent: Optional[int] = None):
+        """Save index to JSON file (compact unless debug_indent is given)"""
         try:
+            if debug_indent is None:
+                text = json.dumps(index, separators=(',', ':'))
+            else:
+                text = json.dumps(index, indent=debug_indent)
+            # One write of the whole document rather than one per encoder chunk
             with open(self.index_file, 'w') as f:
-                json.dump(index, f, indent=2)
+                f.write(text)
         except Exception as e:
             print(f"Error saving index: {e}")
     
+    def _build_lookups(self):
+        """Build id/category/path lookup tables for the current index"""
+        self._cat_by_id = {cat['id']: cat for cat in self.index['categories']}
+        self._by_category = {}
+        self._by_path = {}
+        self._search_keys = []  # (character, category, series) lowercased once per file
+        self._special_count = 0
+        for file_info in self.index['files']:
+            self._by_category.setdefault(file_info['category'], []).append(file_info)
+            self._by_path[file_info['path']] = file_info
+            self._special_count += file_info['special']
+            self._search_keys.append((
+                file_info['character'].lower(),
+                file_info['category'].lower(),
+                file_info['series'].lower(),
+                file_info
+            ))
+        
+        # Sort by character name once, not per lookup (near-linear when already ordered)
+        for characters in self._by_category.values():
+            characters.sort(key=itemgetter('character'))
+    
     def get_categories(self) -> List[Dict]:
         """Get list of all categories"""
         return self.index['categories']
     
     def get_characters(self, category_id: str) -> List[Dict]:
-        """Get characters in a specific category"""
-        # Find category
-        category = None
-        for cat in self.index['categories']:
-            if cat['id'] == category_id:
-                category = cat
-                break
-        
+        """Get characters in a specific category (sorted by name; do not modify)"""
+        category = self._cat_by_id.get(category_id)
         if not category:
             return []
         
-        # Get files for this category
-        characters = []
-        for file_info in self.index['files']:
-            if file_info['category'] == category['name']:
-                characters.append(file_info)
-        
-        # Sort by character name
-        characters.sort(key=lambda x: x['character'])
-        
-        return characters
+        return self._by_category.get(category['name'], [])
     
     def get_file_info(self, file_path: str) -> Optional[Dict]:
         """Get information about a specific file"""
-        for file_info in self.index['files']:
-            if file_info['path'] == file_path:
-                return file_info
-        return None
+        return self._by_path.get(file_path)
     
     def search_files(self, query: str) -> List[Dict]:
         """Search files by name or category"""
         query = query.lower()
-        results = []
+        hits = []
         
-        for file_info in self.index['files']:
-            if (query in file_info['character'].lower() or 
-                query in file_info['category'].lower() or
-                query in file_info['series'].lower()):
-                results.append(file_info)
+        for character, category, series, file_info in self._search_keys:
+            in_character = query in character
+            if in_character or query in category or query in series:
+                hits.append((0 if in_character else 1, file_info['character'], file_info))
         
         # Sort by relevance (character name first, then category)
-        results.sort(key=lambda x: (
-            0 if query in x['character'].lower() else 1,
-            x['character']
-        ))
+        hits.sort(key=lambda hit: hit[:2])
         
-        return results
+        return [hit[2] for hit in hits]
     
     def get_random_file(self) -> Optional[Dict]:
         """Get a random Amiibo file"""
         if not self.index['files']:
             return None
         
-        import random
         return random.choice(self.index['files'])
     
     def get_statistics(self) -> Dict:
@@ -297,20 +389,14 @@ class FileManager:
         total_files = len(self.index['files'])
         total_categories = len(self.index['categories'])
         
-        special_editions = sum(1 for f in self.index['files'] if f['special'])
-        
-        # Most popular categories
-        category_counts = {}
-        for file_info in self.index['files']:
-            category = file_info['category']
-            category_counts[category] = category_counts.get(category, 0) + 1
-        
-        most_popular = sorted(category_counts.items(), key=lambda x: x[1], reverse=True)[:5]
+        # Most popular categories, from the counts stored per category
+        counts = [(cat['name'], cat['count']) for cat in self.index['categories']]
+        most_popular = heapq.nlargest(5, counts, key=itemgetter(1))
         
         return {
             'total_files': total_files,
             'total_categories': total_categories,
-            'special_editions': special_editions,
+            'special_editions': self._special_count,
             'most_popular_categories': most_popular,
             'last_updated': self.index.get('last_updated', 'Unknown')
         }
@@ -319,6 +405,7 @@ class FileManager:
         """Refresh the index by rescanning files"""
         print("Refreshing Amiibo index...")
         self.index = self._create_index()
+        self._build_lookups()
         print("Index refreshed successfully")
     
     def _load_character_map(self) -> Dict:
@@ -333,11 +420,103 @@ class FileManager:
         # For now, return empty dict
         return {}
 
+def _hex_field(start: int, end: int) -> property:
+    """Property decoding bytes [start:end] of the dump as uppercase hex on access"""
+    return property(lambda self: self._data[start:end].hex().upper())
+
+
+class Amiibo:
+    """Parsed .nfc dump - keeps only the raw bytes, fields are decoded on access"""
+    
+    __slots__ = ('_data',)
+    
+    def __init__(self, data: bytes):
+        self._data = bytes(data)
+    
+    uid = _hex_field(0, 7)
+    character_id = _hex_field(8, 10)
+    game_id = _hex_field(10, 12)
+    amiibo_id = _hex_field(14, 22)
+    character_model = _hex_field(22, 24)
+    series_id = _hex_field(24, 26)
+    unknown1 = _hex_field(28, 32)
+    unknown2 = _hex_field(96, 108)
+    unknown3 = _hex_field(140, 144)
+    mii_face = _hex_field(144, 152)
+    mii_hair = _hex_field(152, 160)
+    mii_body = _hex_field(160, 168)
+    mii_accessories = _hex_field(168, 176)
+    mii_colors = _hex_field(176, 184)
+    unknown4 = _hex_field(184, 200)
+    checksum = _hex_field(200, 204)
+    unknown5 = _hex_field(204, 540)
+    
+    @property
+    def raw_data(self) -> bytes:
+        return self._data
+    
+    @property
+    def file_size(self) -> int:
+        return len(self._data)
+    
+    @property
+    def write_counter(self) -> int:
+        return int.from_bytes(self._data[12:14], 'big')
+    
+    @property
+    def figure_type(self) -> int:
+        return self._data[26]
+    
+    @property
+    def version(self) -> int:
+        return self._data[27]
+    
+    @property
+    def mii_data(self) -> bytes:
+        return self._data[32:96]
+    
+    @property
+    def name(self) -> str:
+        return AmiiboParser._extract_name(self._data[108:140])
+    
+    def to_dict(self) -> Dict:
+        """Decode every field (the full dump previously returned by parse_nfc_file)"""
+        data = self._data
+        # One hex conversion for the first 540 bytes; hex fields slice it at 2x offsets
+        h = data[:540].hex().upper()
+        return {
+            'raw_data': data,
+            'file_size': len(data),
+            'uid': h[0:14],
+            'character_id': h[16:20],
+            'game_id': h[20:24],
+            'write_counter': int.from_bytes(data[12:14], 'big'),
+            'amiibo_id': h[28:44],
+            'character_model': h[44:48],
+            'series_id': h[48:52],
+            'figure_type': data[26],
+            'version': data[27],
+            'unknown1': h[56:64],
+            'mii_data': data[32:96],
+            'unknown2': h[192:216],
+            'name': self.name,
+            'unknown3': h[280:288],
+            'mii_face': h[288:304],
+            'mii_hair': h[304:320],
+            'mii_body': h[320:336],
+            'mii_accessories': h[336:352],
+            'mii_colors': h[352:368],
+            'unknown4': h[368:400],
+            'checksum': h[400:408],
+            'unknown5': h[408:1080]
+        }
+
+
 class AmiiboParser:
     """Parser for .nfc file format"""
     
     @staticmethod
-    def parse_nfc_file(file_path: str) -> Optional[Dict]:
+    def parse_nfc_file(file_path: str) -> Optional[Amiibo]:
         """
         Parse .nfc file and extract Amiibo data
         
@@ -345,56 +524,39 @@ class AmiiboParser:
             file_path: Path to .nfc file
         
         Returns:
-            Dictionary with parsed Amiibo data
+            Amiibo whose fields are decoded on access (to_dict() for all of them)
         """
         try:
-            with open(file_path, 'rb') as f:
-                data = f.read()
+            data = AmiiboParser._read_file(file_path)
             
             if len(data) < 540:
                 raise ValueError(f"Invalid .nfc file size: {len(data)} bytes")
             
-            # Parse NFC data structure
-            parsed_data = {
-                'raw_data': data,
-                'file_size': len(data),
-                'uid': data[0:7].hex().upper(),
-                'character_id': data[8:10].hex().upper(),
-                'game_id': data[10:12].hex().upper(),
-                'write_counter': int.from_bytes(data[12:14], 'big'),
-                'amiibo_id': data[14:22].hex().upper(),
-                'character_model': data[22:24].hex().upper(),
-                'series_id': data[24:26].hex().upper(),
-                'figure_type': data[26],
-                'version': data[27],
-                'unknown1': data[28:32].hex().upper(),
-                'mii_data': data[32:96],
-                'unknown2': data[96:108].hex().upper(),
-                'name': AmiiboParser._extract_name(data[108:140]),
-                'unknown3': data[140:144].hex().upper(),
-                'mii_face': data[144:152].hex().upper(),
-                'mii_hair': data[152:160].hex().upper(),
-                'mii_body': data[160:168].hex().upper(),
-                'mii_accessories': data[168:176].hex().upper(),
-                'mii_colors': data[176:184].hex().upper(),
-                'unknown4': data[184:200].hex().upper(),
-                'checksum': data[200:204].hex().upper(),
-                'unknown5': data[204:540].hex().upper()
-            }
-            
-            return parsed_data
+            return Amiibo(data)
             
         except Exception as e:
             print(f"Error parsing .nfc file {file_path}: {e}")
             return None
     
+    @staticmethod
+    def _read_file(file_path: str, size: Optional[int] = None) -> bytes:
+        """Read a file (or its first size bytes) with one unbuffered read"""
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            if size is None:
+                size = os.fstat(fd).st_size
+            return os.read(fd, size)
+        finally:
+            os.close(fd)
+    
     @staticmethod
     def _extract_name(name_bytes: bytes) -> str:
         """Extract UTF-16 name from bytes"""
         try:
-            # Remove null bytes and decode UTF-16
-            name = name_bytes.replace(b'\x00', b'').decode('utf-16le', errors='ignore')
-            return name.strip()
+            # Decode UTF-16 first, then cut at the NUL terminator (stripping NUL
+            # bytes beforehand broke every code unit with a zero byte)
+            name = name_bytes.decode('utf-16le', errors='ignore')
+            return name.split('\x00', 1)[0].strip()
         except:
             return "Unknown"
     
@@ -402,16 +564,15 @@ class AmiiboParser:
     def validate_nfc_file(file_path: str) -> bool:
         """Validate .nfc file format"""
         try:
-            with open(file_path, 'rb') as f:
-                data = f.read()
-            
-            # Check minimum size
-            if len(data) < 540:
+            # Size check needs only metadata - one stat, no read
+            st = os.stat(file_path)
+            if not stat.S_ISREG(st.st_mode) or st.st_size < 540:
                 return False
             
-            # Check for valid header (would need actual validation logic)
+            # Check for valid header (would need actual validation logic;
+            # read just the header with _read_file(file_path, n) when added)
             # This is a simplified check
             return True
             
-        except:
+        except OSError:
             return False
\ No newline at end of file
@@ -0,0 +1,32 @@
+"""
+Shared I2C Bus for Raspberry Pi
+
+One SMBus handle and lock per bus number, so the PN532 writer, the server
+and the utility scripts never interleave transactions on the same bus.
+The LCD driver (ui_controller_rpi) opens its own handle and does not use it.
+"""
+
+import threading
+import smbus2
+
+_buses = {}
+_buses_lock = threading.Lock()
+
+
+def get_bus(num=1):
+    """Get the process-wide (SMBus, lock) pair for an I2C bus, opening it on first use"""
+    with _buses_lock:
+        if num not in _buses:
+            # Reentrant so a transaction helper can call other locked helpers
+            _buses[num] = (smbus2.SMBus(num), threading.RLock())
+        return _buses[num]
+
+
+def close_bus(num=1):
+    """Close a bus opened by get_bus (no-op if it is not open)"""
+    with _buses_lock:
+        entry = _buses.pop(num, None)
+    if entry:
+        bus, lock = entry
+        with lock:
+            bus.close()
@@ -6,16 +6,20 @@ Rewritable Amiibo system - write any Amiibo to a single NTAG215 tag!
 
 import time
 import gc
+import logging
 import signal
 import sys
+import threading
+import RPi.GPIO as GPIO
 
 # Force unbuffered output for immediate debug logs
 sys.stdout = sys.stderr = open(sys.stdout.fileno(), 'w', buffering=1)
 
 from amiibo_emulator.src.nfc_controller_writer import AmiiboWriter
+from amiibo_emulator.src.i2c_bus import get_bus, close_bus
 from amiibo_emulator.src.file_manager import FileManager
 from ui_controller_rpi import UIController
-from amiibo_emulator.src.config_rpi import HardwareConfig, AppConfig
+from amiibo_emulator.src.config_rpi import HardwareConfig, AppConfig, DebugConfig
 
 class AmiiboWriterApp:
     """Main Amiibo Writer Application for Raspberry Pi"""
@@ -28,6 +32,10 @@ class AmiiboWriterApp:
     STATE_WRITE_COMPLETE = 4
     STATE_WRITE_ERROR = 5
     
+    # Seconds between collections, and how often (in cycles) to do a full one
+    GC_INTERVAL = 10
+    FULL_GC_EVERY = 6
+    
     def __init__(self):
         """Initialize the Amiibo Writer Application"""
         print("Initializing Amiibo Writer for Raspberry Pi...")
@@ -36,6 +44,7 @@ class AmiiboWriterApp:
         
         # Initialize components
         self.file_manager = FileManager()
+        self._refresh_state()
         
         # Initialize UI controller with I2C
         self.ui_controller = UIController(
@@ -44,10 +53,13 @@ class AmiiboWriterApp:
             lcd_address=HardwareConfig.LCD_I2C_ADDRESS
         )
         
-        # Initialize NFC writer with shared I2C bus
+        # Initialize NFC writer on the process-wide I2C handle and its lock.
+        # The LCD driver opens its own handle and does not take this lock
+        bus, bus_lock = get_bus(HardwareConfig.I2C_BUS)
         self.nfc_writer = AmiiboWriter(
             i2c_bus=HardwareConfig.I2C_BUS,
-            shared_i2c=self.ui_controller.lcd.bus if self.ui_controller.lcd_initialized else None
+            shared_i2c=bus,
+            shared_lock=bus_lock
         )
         
         # Application state
@@ -62,6 +74,15 @@ class AmiiboWriterApp:
         # Statistics
         self.write_count = 0
         
+        # Set by button edges (and shutdown) so the main loop sleeps until there is input
+        self._wake = threading.Event()
+        self._poll_interval = 1.0 if self._watch_buttons() else 0.1
+        self._last_ui_key = None  # What the LCD currently shows, see _update_ui
+        
+        # Garbage collection schedule
+        self._next_gc = time.monotonic() + self.GC_INTERVAL
+        self._gc_cycles = 0
+        
         # Setup signal handlers
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
@@ -79,17 +100,42 @@ class AmiiboWriterApp:
         self.ui_controller.check_buttons()
         print("Startup complete - ready for input")
     
+    def _refresh_state(self):
+        """Cache data derived from the file index (call again after refresh_index)"""
+        self._categories = self.file_manager.get_categories()
+    
     def _signal_handler(self, sig, frame):
         """Handle shutdown signals"""
         print("\nShutdown signal received...")
         self.is_running = False
+        self._wake.set()
+    
+    def _watch_buttons(self):
+        """Wake the main loop on button edges; False if edge detection is unavailable"""
+        def on_edge(channel):
+            self._wake.set()
+        
+        try:
+            pins = HardwareConfig.BUTTON_PINS
+            if isinstance(pins, dict):
+                pins = pins.values()
+            for pin in pins:
+                try:
+                    GPIO.add_event_detect(pin, GPIO.BOTH, callback=on_edge)
+                except RuntimeError:
+                    # UI controller already watches this pin - add to its callbacks
+                    GPIO.add_event_callback(pin, on_edge)
+            return True
+        except Exception as e:
+            print(f"⚠ Button edge detection unavailable, polling instead: {e}")
+            return False
     
     def run(self):
         """Main application loop"""
         print("Starting main application loop...")
         
         # Force initial display update
-        categories = self.file_manager.get_categories()
+        categories = self._categories
         if categories:
             self.ui_controller.current_state = self.ui_controller.STATE_CATEGORY_BROWSER
             self.ui_controller.selected_category = 0
@@ -97,26 +143,29 @@ class AmiiboWriterApp:
             print(f"Displaying category: {categories[0]['name']}")
         
         time.sleep(0.5)
-        last_update_time = time.time()
         
         while self.is_running:
             try:
-                current_time = time.time()
-                delta_time = current_time - last_update_time
-                last_update_time = current_time
-                
                 # Update UI based on state
                 self._update_ui()
                 
                 # Handle user input
                 self._handle_user_input()
                 
-                # Garbage collection
-                if current_time % 10 < delta_time:
-                    gc.collect()
+                # Garbage collection on a fixed schedule; young generations only,
+                # with a full collection every FULL_GC_EVERY cycles
+                now = time.monotonic()
+                if now >= self._next_gc:
+                    self._gc_cycles += 1
+                    if self._gc_cycles % self.FULL_GC_EVERY == 0:
+                        gc.collect()
+                    else:
+                        gc.collect(1)
+                    self._next_gc = now + self.GC_INTERVAL
                 
-                # Small delay
-                time.sleep(0.1)
+                # Sleep until a button edge (or housekeeping timeout)
+                self._wake.wait(self._poll_interval)
+                self._wake.clear()
                 
             except KeyboardInterrupt:
                 print("Application interrupted by user")
@@ -128,8 +177,15 @@ class AmiiboWriterApp:
                 time.sleep(1)
     
     def _update_ui(self):
-        """Update the user interface"""
-        categories = self.file_manager.get_categories()
+        """Update the user interface (skipped when nothing shown has changed)"""
+        key = (self.app_state, self.ui_controller.current_state,
+               self.current_category_index, self.current_character_index,
+               self.write_progress, self.current_amiibo)
+        if key == self._last_ui_key:
+            return
+        self._last_ui_key = key
+        
+        categories = self._categories
         characters = []
         
         # Get current characters if in character browser
@@ -158,12 +214,13 @@ class AmiiboWriterApp:
                 )
             except OSError as e:
                 print(f"⚠ UI update skipped (I2C busy): {e}")
+                self._last_ui_key = None  # Retry on the next pass
     
     def _handle_user_input(self):
         """Handle user input from buttons"""
         self.last_activity = time.time()
         
-        categories = self.file_manager.get_categories()
+        categories = self._categories
         characters = []
         
         if self.ui_controller.current_state == self.ui_controller.STATE_CHARACTER_BROWSER:
@@ -215,7 +272,7 @@ class AmiiboWriterApp:
     
     def _load_selected_character(self):
         """Load the currently selected character"""
-        categories = self.file_manager.get_categories()
+        categories = self._categories
         if not categories:
             return
         
@@ -246,7 +303,7 @@ class AmiiboWriterApp:
         
         print(f"Starting write process for: {self.current_amiibo.get('character', 'Unknown')}")
         self.app_state = self.STATE_WAITING_FOR_TAG
-        self.ui_controller.display_text("Place tag on", "reader...")
+        self._update_ui()
         
         # Wait a moment for user to see message
         time.sleep(1)
@@ -259,9 +316,16 @@ class AmiiboWriterApp:
         self.app_state = self.STATE_WRITING
         self.write_progress = 0
         
+        # Redraw only every 5% or 100 ms so the LCD doesn't compete with the
+        # writer for the I2C bus; last = [progress, time] of the last redraw
+        last = [-1, 0.0]
+        
         def progress_callback(progress):
             self.write_progress = progress
-            self._update_ui()
+            now = time.monotonic()
+            if progress - last[0] >= 5 or now - last[1] > 0.1:
+                last[0], last[1] = progress, now
+                self._update_ui()
         
         try:
             if self.nfc_writer.write_to_tag(progress_callback):
@@ -282,11 +346,14 @@ class AmiiboWriterApp:
             self.app_state = self.STATE_WRITE_ERROR
             time.sleep(2)
             self.app_state = self.STATE_BROWSING
+        finally:
+            # The LCD shows a write screen; make the next pass redraw the browser
+            self._last_ui_key = None
     
     def get_status(self):
         """Get application status"""
         return {
-            'categories': len(self.file_manager.get_categories()),
+            'categories': len(self._categories),
             'current_category': self.current_category_index,
             'current_character': self.current_character_index,
             'current_amiibo': self.current_amiibo.get('character', 'None') if self.current_amiibo else 'None',
@@ -310,17 +377,20 @@ class AmiiboWriterApp:
         """Stop the application"""
         print("Stopping Amiibo Writer...")
         self.is_running = False
+        self._wake.set()
         self.ui_controller.enter_sleep_mode()
         
         # Cleanup resources
         try:
             self.nfc_writer.cleanup()
             self.ui_controller.cleanup()
+            close_bus(HardwareConfig.I2C_BUS)
         except Exception as e:
             print(f"Error during cleanup: {e}")
 
 def main():
     """Main entry point"""
+    logging.basicConfig(level=DebugConfig.LOG_LEVEL, format='%(levelname)s %(name)s: %(message)s')
     app = None
     try:
         # Create and run application
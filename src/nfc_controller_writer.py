@@ -4,45 +4,107 @@ PN532 NFC Controller for Writing NTAG215 Tags
 Implements tag writing for rewritable Amiibo system.
 """
 
+import re
 import time
+import struct
+import logging
+import threading
 import smbus2
 import RPi.GPIO as GPIO
 
+from amiibo_emulator.src.i2c_bus import get_bus
+
+from amiibo_emulator.src.config_rpi import (
+    PN532_I2C_ADDRESS, PN532_T_I2C, PN532_NACK_RETRIES,
+    PN532_PREAMBLE, PN532_STARTCODE1, PN532_STARTCODE2,
+    PN532_POSTAMBLE, PN532_HOSTTOPN532, PN532_PN532TOHOST,
+    COMMAND_GETFIRMWAREVERSION, COMMAND_SAMCONFIGURATION,
+    COMMAND_INLISTPASSIVETARGET, COMMAND_INDATAEXCHANGE,
+    NTAG_CMD_READ, NTAG_CMD_WRITE, NTAG_CMD_FAST_READ,
+    PN532_FRAME_FIRMWARE, PN532_FRAME_SAM, PN532_FRAME_DETECT,
+)
+
+log = logging.getLogger("nfc")
+
+# PREAMBLE, START1, START2, LEN, LCS, TFI, CMD
+_FRAME_HEADER = struct.Struct('7B')
+
+# Flipper .nfc lines we need, e.g. "UID: 04 A1 B2 ..." and "Page 12: 00 11 22 33"
+_FLIPPER_UID_RE = re.compile(r'^UID:([0-9A-Fa-f ]+)', re.M)
+_FLIPPER_PAGE_RE = re.compile(r'^Page (\d+):([0-9A-Fa-f ]+)', re.M)
+
+
+def parse_target_uid(response):
+    """Extract the first target's UID from an InListPassiveTarget reply, or None.
+    
+    After TFI+code (D5 4B) the reply is: NbTg, Tg, SENS_RES(2), SEL_RES,
+    NFCIDLength, NFCID...
+    """
+    i = response.find(b'\xD5\x4B')
+    if i < 0 or i + 8 > len(response) or response[i + 2] != 1:
+        return None
+    
+    uid_len = response[i + 7]
+    uid = response[i + 8:i + 8 + uid_len]
+    # Reject short reads and the filler patterns seen with no real tag
+    if not 4 <= uid_len <= 10 or len(uid) != uid_len:
+        return None
+    if not uid.strip(b'\x00') or not uid.strip(b'\x80'):
+        return None
+    return uid
+
+
 class NFCWriter:
     """PN532 controller for writing NTAG215 tags"""
     
     # PN532 Commands
-    CMD_GETFIRMWAREVERSION = 0x02
-    CMD_SAMCONFIGURATION = 0x14
-    CMD_INLISTPASSIVETARGET = 0x4A
-    CMD_INDATAEXCHANGE = 0x40
+    CMD_GETFIRMWAREVERSION = COMMAND_GETFIRMWAREVERSION
+    CMD_SAMCONFIGURATION = COMMAND_SAMCONFIGURATION
+    CMD_INLISTPASSIVETARGET = COMMAND_INLISTPASSIVETARGET
+    CMD_INDATAEXCHANGE = COMMAND_INDATAEXCHANGE
     
     # NTAG215 Commands
-    NTAG_CMD_READ = 0x30
-    NTAG_CMD_WRITE = 0xA2
+    NTAG_CMD_READ = NTAG_CMD_READ
+    NTAG_CMD_WRITE = NTAG_CMD_WRITE
     
     # Response codes
-    PN532_PREAMBLE = 0x00
-    PN532_STARTCODE1 = 0x00
-    PN532_STARTCODE2 = 0xFF
-    PN532_POSTAMBLE = 0x00
-    PN532_HOSTTOPN532 = 0xD4
-    PN532_PN532TOHOST = 0xD5
+    PN532_PREAMBLE = PN532_PREAMBLE
+    PN532_STARTCODE1 = PN532_STARTCODE1
+    PN532_STARTCODE2 = PN532_STARTCODE2
+    PN532_POSTAMBLE = PN532_POSTAMBLE
+    PN532_HOSTTOPN532 = PN532_HOSTTOPN532
+    PN532_PN532TOHOST = PN532_PN532TOHOST
+    
+    # ACK frame the PN532 sends before each response
+    ACK_FRAME = b'\x00\x00\xff\x00\xff\x00'
+    
+    # Pages written between progress reports
+    WRITE_CHUNK_PAGES = 16
     
-    def __init__(self, i2c_bus=1, shared_i2c=None):
+    # Pages per FAST_READ; keeps each reply well inside the PN532 frame limit
+    READ_CHUNK_PAGES = 32
+    
+    # NTAG215 dump size (135 pages x 4 bytes)
+    AMIIBO_SIZE = 540
+    
+    def __init__(self, i2c_bus=1, shared_i2c=None, shared_lock=None):
         GPIO.setmode(GPIO.BCM)
         GPIO.setwarnings(False)
         
-        # Use shared I2C bus if provided
+        # Use shared I2C bus if provided, otherwise the process-wide one;
+        # the lock is held for each whole command/response transaction.
+        # Either way the bus belongs to the process: main()/stop() close it
+        self.i2c_bus = i2c_bus
         if shared_i2c:
             self.i2c = shared_i2c
-            self.owns_i2c = False
+            self._lock = shared_lock or threading.RLock()
         else:
-            self.i2c = smbus2.SMBus(i2c_bus)
-            self.owns_i2c = True
+            self.i2c, self._lock = get_bus(i2c_bus)
         
-        self.address = 0x24
+        self.address = PN532_I2C_ADDRESS
         self.current_amiibo = None
+        self.i2c_failures = 0  # Transactions that failed every retry this session
+        self._resetting = False
         
         print("PN532 NFC Writer initializing...")
         
@@ -59,19 +121,9 @@ class NFCWriter:
     def get_firmware_version(self):
         """Get firmware version"""
         try:
-            cmd = [0x00, 0x00, 0xFF, 0x02, 0xFE, 0xD4, 0x02, 0x2A, 0x00]
-            msg = smbus2.i2c_msg.write(self.address, cmd)
-            self.i2c.i2c_rdwr(msg)
-            
-            time.sleep(0.05)
+            response = self._txn(PN532_FRAME_FIRMWARE, 20)
             
-            msg = smbus2.i2c_msg.read(self.address, 20)
-            self.i2c.i2c_rdwr(msg)
-            response = list(msg)
-            
-            if len(response) > 12 and response[0] == 0x01:
-                return (response[9], response[10], response[11], response[12])
-            elif len(response) > 12:
+            if response and len(response) > 11:
                 return (response[8], response[9], response[10], response[11])
             return None
         except Exception as e:
@@ -81,10 +133,8 @@ class NFCWriter:
     def _configure_sam(self):
         """Configure SAM for normal mode"""
         try:
-            cmd = self._build_command(self.CMD_SAMCONFIGURATION, [0x01, 0x14, 0x01])
-            self._send_command(cmd)
-            time.sleep(0.05)
-            response = self._read_response()
+            # Normal mode, 1 s timeout, use IRQ
+            response = self._txn(PN532_FRAME_SAM)
             
             if response and len(response) > 0:
                 print("✓ SAM configured for tag writing")
@@ -96,101 +146,122 @@ class NFCWriter:
             print(f"Error configuring SAM: {e}")
             return False
     
-    def _build_command(self, cmd, data=None):
-        """Build PN532 command frame"""
-        if data is None:
-            data = []
-        
-        length = len(data) + 1
-        lcs = (~length + 1) & 0xFF
-        
-        frame = [
-            self.PN532_PREAMBLE,
-            self.PN532_STARTCODE1,
-            self.PN532_STARTCODE2,
-            length,
-            lcs,
-            self.PN532_HOSTTOPN532,
-            cmd
-        ]
-        
-        frame.extend(data)
+    def _soft_reset(self):
+        """Wake the PN532 and redo SAM configuration after repeated bus errors"""
+        if self._resetting:
+            return False  # SAM configuration itself failed; don't recurse
+        self._resetting = True
+        try:
+            # On I2C any addressed transfer wakes the chip; it is not answered yet
+            try:
+                with self._lock:
+                    self.i2c.i2c_rdwr(smbus2.i2c_msg.read(self.address, 1))
+            except OSError:
+                pass
+            time.sleep(PN532_T_I2C)
+            
+            ok = self._configure_sam()
+            log.warning("PN532 soft reset %s", "succeeded" if ok else "failed")
+            return ok
+        finally:
+            self._resetting = False
+    
+    def _build_command(self, cmd, data=b''):
+        """Build PN532 command frame (data may be bytes or a list of ints)"""
+        n = len(data)
+        length = n + 2  # TFI + command code + data
         
-        dcs = (~sum([self.PN532_HOSTTOPN532, cmd] + data) + 1) & 0xFF
-        frame.append(dcs)
-        frame.append(self.PN532_POSTAMBLE)
+        frame = bytearray(9 + n)
+        _FRAME_HEADER.pack_into(frame, 0, PN532_PREAMBLE, PN532_STARTCODE1, PN532_STARTCODE2,
+                                length, -length & 0xFF, PN532_HOSTTOPN532, cmd)
+        frame[7:7 + n] = data
+        frame[7 + n] = -(PN532_HOSTTOPN532 + cmd + sum(data)) & 0xFF
+        frame[8 + n] = PN532_POSTAMBLE
         
         return frame
     
-    def _send_command(self, cmd):
-        """Send command to PN532"""
-        try:
-            time.sleep(0.01)
-            msg = smbus2.i2c_msg.write(self.address, cmd)
+    def _wait_ready(self, timeout_ms=100):
+        """Poll the PN532 status byte until it reports ready (0x01); False on timeout"""
+        deadline = time.monotonic() + timeout_ms / 1000
+        while True:
+            msg = smbus2.i2c_msg.read(self.address, 1)
             self.i2c.i2c_rdwr(msg)
-            time.sleep(0.01)
-            return True
-        except Exception as e:
-            print(f"Error sending command: {e}")
-            return False
+            if bytes(msg)[0] == 0x01:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.001)
     
-    def _read_response(self, length=64):
-        """Read response from PN532"""
-        try:
-            time.sleep(0.05)
+    def _read_frame(self, length, timeout_ms=100, ready=False):
+        """Wait for ready and read a frame (status byte included), skipping a leading ACK"""
+        for _ in range(2):
+            # On timeout read anyway - callers reject whatever is there
+            if not ready:
+                self._wait_ready(timeout_ms)
+            ready = False
             msg = smbus2.i2c_msg.read(self.address, length)
             self.i2c.i2c_rdwr(msg)
-            response = list(msg)
+            frame = bytes(msg)  # One C-level copy instead of a list of ints
+            if frame[1:7] != self.ACK_FRAME:
+                break
+        return frame
+    
+    def _txn(self, cmd, read_len=64, timeout_ms=100):
+        """Send a command frame and return its response (status byte stripped), or None on error"""
+        try:
+            # The command and the first ready poll go out in one i2c_rdwr call.
+            # No guard delays needed: the chip is awake after SAM configuration
+            write = smbus2.i2c_msg.write(self.address, cmd)
+            status = smbus2.i2c_msg.read(self.address, 1)
+            for attempt in range(1, PN532_NACK_RETRIES + 1):
+                try:
+                    with self._lock:
+                        self.i2c.i2c_rdwr(write, status)
+                        response = self._read_frame(read_len, timeout_ms, ready=bytes(status)[0] == 0x01)
+                    break
+                except OSError as e:
+                    # A busy PN532 occasionally NACKs; it is ready again after t_I2C
+                    if attempt == PN532_NACK_RETRIES:
+                        self.i2c_failures += 1
+                        log.warning("PN532 transaction failed after %d tries (%d this session): %s",
+                                    attempt, self.i2c_failures, e)
+                        self._soft_reset()
+                        raise
+                    time.sleep(PN532_T_I2C)
             
             if response[0] == 0x01:
                 response = response[1:]
             
             return response
         except Exception as e:
-            print(f"Error reading response: {e}")
+            print(f"Error in PN532 transaction: {e}")
             return None
     
-    def detect_tag(self):
-        """Detect if an NTAG215 tag is present"""
+    def detect_tag(self, verbose=True):
+        """Detect if an NTAG215 tag is present (verbose=False for quiet polling)"""
         try:
-            print("Detecting tag...")
+            if verbose:
+                print("Detecting tag...")
             # InListPassiveTarget: 1 card, 106 kbps type A
-            cmd = self._build_command(self.CMD_INLISTPASSIVETARGET, [0x01, 0x00])
-            
-            if not self._send_command(cmd):
-                print("Failed to send detect command")
-                return None
-            
-            time.sleep(0.2)  # Longer wait for tag detection
-            response = self._read_response()
+            # Tag detection takes longer; with no tag the PN532 never becomes ready
+            response = self._txn(PN532_FRAME_DETECT, timeout_ms=300)
             
             if not response:
-                print("No response from PN532")
+                if verbose:
+                    print("No response from PN532")
                 return None
             
-            # Debug: show response
-            print(f"Response length: {len(response)}")
-            print(f"Response: {bytes(response[:20]).hex()}")
-            
-            # Parse response - format varies, try different offsets
-            # Look for number of targets byte
-            for offset in range(min(10, len(response))):
-                if response[offset] > 0 and response[offset] < 5:  # Reasonable number of tags
-                    # Try to extract UID
-                    try:
-                        uid_offset = offset + 5
-                        if uid_offset < len(response):
-                            uid_length = response[uid_offset]
-                            if 4 <= uid_length <= 10:  # Valid UID length
-                                uid = bytes(response[uid_offset+1:uid_offset+1+uid_length])
-                                if len(uid) == uid_length:
-                                    print(f"✓ Tag detected: UID = {uid.hex().upper()}")
-                                    return uid
-                    except:
-                        continue
+            # Debug: show response (formatted only when DEBUG is enabled)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Response (%d bytes): %s", len(response), response[:20].hex())
             
-            print("No tag detected (no valid UID found in response)")
-            return None
+            uid = parse_target_uid(response)
+            if verbose:
+                if uid:
+                    print(f"✓ Tag detected: UID = {uid.hex().upper()}")
+                else:
+                    print("No tag detected (no valid UID found in response)")
+            return uid
             
         except Exception as e:
             print(f"Error detecting tag: {e}")
@@ -205,26 +276,56 @@ class NFCWriter:
                 raise ValueError("Page data must be exactly 4 bytes")
             
             # InDataExchange: write command
-            cmd_data = [0x01, self.NTAG_CMD_WRITE, page_num] + list(data)
-            cmd = self._build_command(self.CMD_INDATAEXCHANGE, cmd_data)
-            
-            if not self._send_command(cmd):
-                return False
+            cmd_data = bytes((0x01, NTAG_CMD_WRITE, page_num)) + bytes(data)
+            cmd = self._build_command(COMMAND_INDATAEXCHANGE, cmd_data)
             
-            time.sleep(0.05)
-            response = self._read_response()
+            response = self._txn(cmd)
             
-            # Check for success (response should contain 0xD5 0x41 0x00)
-            if response and len(response) > 8:
-                if response[6] == 0xD5 and response[7] == 0x41 and response[8] == 0x00:
-                    return True
-            
-            return False
+            # Success is D5 41 with status 00 (the status byte is already stripped)
+            return bool(response) and response.find(b'\xD5\x41\x00') >= 0
             
         except Exception as e:
             print(f"Error writing page {page_num}: {e}")
             return False
     
+    def read_pages(self, start_page, end_page):
+        """Read pages start_page..end_page (inclusive) with FAST_READ; None on failure"""
+        data = bytearray()
+        for first in range(start_page, end_page + 1, self.READ_CHUNK_PAGES):
+            last = min(first + self.READ_CHUNK_PAGES - 1, end_page)
+            size = (last - first + 1) * 4
+            
+            cmd_data = bytes((0x01, NTAG_CMD_FAST_READ, first, last))
+            response = self._txn(self._build_command(COMMAND_INDATAEXCHANGE, cmd_data), read_len=size + 16)
+            if not response:
+                return None
+            
+            # Reply: D5 41 status, then the page bytes
+            i = response.find(b'\xD5\x41')
+            if i < 0 or len(response) < i + 3 + size or response[i + 2] != 0x00:
+                return None
+            data += response[i + 3:i + 3 + size]
+        return bytes(data)
+    
+    def write_pages(self, start_page, data, current=None):
+        """Write consecutive 4-byte pages from start_page, back to back; returns pages written.
+        
+        Pages whose bytes already match current (the tag's contents) are skipped
+        and counted as written.
+        """
+        written = 0
+        for offset in range(0, len(data), 4):
+            page = start_page + offset // 4
+            page_data = data[offset:offset+4]
+            if current is not None and current[offset:offset+4] == page_data:
+                written += 1
+                continue
+            if not self.write_page(page, page_data):
+                print(f"✗ Failed to write page {page}")
+                break
+            written += 1
+        return written
+    
     def write_amiibo(self, amiibo_data, progress_callback=None):
         """Write Amiibo data to NTAG215 tag"""
         try:
@@ -247,27 +348,37 @@ class NFCWriter:
             # Pages 3-129 contain Amiibo data
             # Pages 130-134 are configuration/lock bytes
             
-            total_pages = 135
+            first_page, end_page = 4, 130  # Main data pages (skip UID pages 0-2)
+            total = end_page - first_page
             success_count = 0
             
-            for page in range(4, 130):  # Write main data pages (skip UID pages 0-2)
-                offset = page * 4
-                page_data = raw_data[offset:offset+4]
-                
-                if len(page_data) < 4:
-                    page_data = page_data + b'\x00' * (4 - len(page_data))
+            # Read what the tag already holds so identical pages are not rewritten
+            current = self.read_pages(first_page, end_page - 1)
+            if current is None:
+                print("Could not read tag contents - writing every page")
+            elif self.detect_tag(verbose=False) != uid:
+                # A different tag may have been read; don't skip pages based on it
+                print("Tag changed during read - writing every page")
+                current = None
+            
+            # Views, not copies: each page goes straight into its command frame
+            data_view = memoryview(raw_data)
+            current_view = memoryview(current) if current is not None else None
+            
+            for start in range(first_page, end_page, self.WRITE_CHUNK_PAGES):
+                count = min(self.WRITE_CHUNK_PAGES, end_page - start)
+                chunk = data_view[start * 4:(start + count) * 4]
+                before = None
+                if current_view is not None:
+                    before = current_view[(start - first_page) * 4:(start - first_page + count) * 4]
                 
-                if self.write_page(page, page_data):
-                    success_count += 1
-                    if progress_callback:
-                        progress = int((page - 4) / (130 - 4) * 100)
-                        progress_callback(progress)
-                else:
-                    print(f"✗ Failed to write page {page}")
+                written = self.write_pages(start, chunk, before)
+                success_count += written
+                if written < count:
                     return False
                 
-                # Small delay between writes
-                time.sleep(0.01)
+                if progress_callback:
+                    progress_callback(int(success_count / total * 100))
             
             print(f"✓ Successfully wrote {success_count} pages")
             return True
@@ -285,8 +396,10 @@ class NFCWriter:
             filename = os.path.basename(file_path)
             character_name = filename.replace('.nfc', '').replace('_', ' ')
             
-            with open(file_path, 'r') as f:
-                content = f.read()
+            # Latin-1 cannot fail and skips UTF-8 decoding and newline
+            # translation; only the ASCII keys and hex digits matter
+            with open(file_path, 'rb') as f:
+                content = f.read().decode('latin-1')
             
             if content.startswith('Filetype: Flipper'):
                 print("Detected Flipper Zero format")
@@ -302,32 +415,32 @@ class NFCWriter:
     
     def _parse_flipper_format(self, content, character_name):
         """Parse Flipper Zero .nfc format"""
-        lines = content.split('\n')
-        uid_bytes = b''
-        data_pages = {}
-        
-        for line in lines:
-            line = line.strip()
-            if line.startswith('UID:'):
-                hex_str = line.split(':', 1)[1].strip()
-                uid_bytes = bytes.fromhex(hex_str.replace(' ', ''))
-                print(f"Found UID in file: {uid_bytes.hex().upper()}")
-            elif line.startswith('Page '):
-                parts = line.split(':', 1)
-                if len(parts) >= 2:
-                    page_num = int(parts[0].split()[1])
-                    hex_data = parts[1].strip()
-                    data_pages[page_num] = bytes.fromhex(hex_data.replace(' ', ''))
-        
+        # bytes.fromhex skips the spaces between hex pairs itself
+        match = _FLIPPER_UID_RE.search(content)
+        uid_bytes = bytes.fromhex(match.group(1)) if match else b''
         if not uid_bytes:
             raise ValueError("No UID found in Flipper format file")
+        print(f"Found UID in file: {uid_bytes.hex().upper()}")
         
         # Reconstruct raw data from pages
-        raw_data = bytearray(540)
-        for page_num, page_data in data_pages.items():
-            offset = page_num * 4
-            if offset + len(page_data) <= len(raw_data):
-                raw_data[offset:offset+len(page_data)] = page_data
+        raw_data = bytearray(self.AMIIBO_SIZE)
+        size = len(raw_data)
+        pages = _FLIPPER_PAGE_RE.findall(content)
+        
+        # Flipper lists pages 0..N in order: decode all of them in one call
+        data = None
+        if pages and pages[0][0] == '0' and int(pages[-1][0]) == len(pages) - 1:
+            data = bytes.fromhex(' '.join([hex_str for _, hex_str in pages]))
+        
+        if data is not None and len(data) == 4 * len(pages) and len(data) <= size:
+            raw_data[:len(data)] = data
+        else:
+            for page_num, hex_str in pages:
+                page_data = bytes.fromhex(hex_str)
+                offset = int(page_num) * 4
+                end = offset + len(page_data)
+                if end <= size:
+                    raw_data[offset:end] = page_data
         
         return {
             'raw_data': bytes(raw_data),
@@ -338,8 +451,6 @@ class NFCWriter:
     def cleanup(self):
         """Cleanup resources"""
         try:
-            if self.owns_i2c:
-                self.i2c.close()
             GPIO.cleanup()
         except:
             pass
@@ -348,8 +459,8 @@ class NFCWriter:
 class AmiiboWriter:
     """Amiibo writer with tag detection and writing"""
     
-    def __init__(self, i2c_bus=1, shared_i2c=None):
-        self.nfc_writer = NFCWriter(i2c_bus, shared_i2c)
+    def __init__(self, i2c_bus=1, shared_i2c=None, shared_lock=None):
+        self.nfc_writer = NFCWriter(i2c_bus, shared_i2c, shared_lock)
         self.current_amiibo = None
     
     def load_amiibo(self, file_path):
@@ -5,17 +5,78 @@ Headless Amiibo Server for Raspberry Pi
 Runs without LCD - controlled via network API.
 """
 
+import os
 import time
 import json
+import logging
+import queue
 import socket
+import selectors
 import threading
 from amiibo_emulator.src.nfc_controller_writer import AmiiboWriter
+from amiibo_emulator.src.i2c_bus import get_bus, close_bus
+from amiibo_emulator.src.config_rpi import DebugConfig
 from amiibo_emulator.src.file_manager import FileManager
 import RPi.GPIO as GPIO
 
+# One shared codec: compact separators, built once instead of per message
+_json_encoder = json.JSONEncoder(separators=(',', ':'))
+_json_decoder = json.JSONDecoder()
+
+
+# Pushed messages start with a fixed-width version so subscribers can skip
+# unchanged ones without decoding, e.g. b'V0000000017 {...}\n'
+PUSH_HEADER = b'V%010d '
+
+
+def encode_message(obj):
+    """Encode one protocol message (JSON object + newline delimiter)"""
+    return _json_encoder.encode(obj).encode('utf-8') + b'\n'
+
+
+def _pin_current_thread(cpus):
+    """Restrict the calling thread to some CPUs; no-op on single-core or non-Linux"""
+    if not hasattr(os, 'sched_setaffinity'):
+        return
+    available = os.sched_getaffinity(0)
+    cpus = set(cpus) & available
+    if len(available) < 2 or not cpus:
+        return
+    try:
+        os.sched_setaffinity(0, cpus)  # pid 0 = this thread on Linux
+    except OSError as e:
+        print(f"Could not set CPU affinity: {e}")
+
+
+class _Connection:
+    """Per-client buffers and wait state for the event loop"""
+    
+    __slots__ = ('sock', 'address', 'rbuf', 'rlen', 'wbuf',
+                 'waiting', 'subscribed', 'since', 'deadline')
+    
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.rbuf = bytearray(4096)
+        self.rlen = 0
+        self.wbuf = bytearray()
+        self.waiting = False  # Holding a wait_for_change request
+        self.subscribed = False  # Push-only after 'subscribe'
+        self.since = None
+        self.deadline = 0.0
+
+
 class AmiiboServer:
     """Headless Amiibo server with network API"""
     
+    DETECT_INTERVAL = 0.3  # Seconds between tag polls while no job is queued
+    NFC_CPU = 0  # Core reserved for the NFC worker; sockets use the rest
+    NFC_NICE = -5  # Only applied when running as root
+    MAX_MESSAGE_SIZE = 65536  # Receive buffer limit for one command
+    HEARTBEAT_INTERVAL = 25  # Seconds between pushes to an idle subscriber
+    # Older clients send a single JSON object per connection with no newline
+    ACCEPT_UNTERMINATED = True
+    
     def __init__(self, port=5555):
         self.port = port
         self.running = False
@@ -24,7 +85,8 @@ class AmiiboServer:
         # Initialize components
         print("Initializing headless Amiibo server...")
         self.file_manager = FileManager()
-        self.nfc_writer = AmiiboWriter(i2c_bus=1)
+        bus, bus_lock = get_bus(1)
+        self.nfc_writer = AmiiboWriter(shared_i2c=bus, shared_lock=bus_lock)
         
         # State
         self.current_category = 0
@@ -33,31 +95,119 @@ class AmiiboServer:
         self.write_progress = 0
         self.status = "idle"
         
+        # Bumped on every state change; the event loop is woken to answer waiters
+        self._state_version = 0
+        self._state_lock = threading.Lock()
+        self._catalog_version = 0  # Bumped when category/character lists change
+        self._categories, self._characters, self._catalog = self._build_catalog()
+        
+        # All PN532 access happens on one worker thread: queued jobs (writes) run
+        # in order, and between jobs it polls for a tag so detect_tag is a cache read
+        self._nfc_queue = queue.Queue()
+        self._nfc_thread = None
+        self._last_tag_uid = None
+        self._job_id = 0
+        
+        # Event loop: every client socket is served from the thread running start()
+        self._selector = None
+        self._connections = set()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._loop_calls = queue.SimpleQueue()  # Run by the event loop on behalf of other threads
+        
         # Setup GPIO (minimal - no buttons needed)
         GPIO.setmode(GPIO.BCM)
         GPIO.setwarnings(False)
         
         print(f"✓ Server initialized on port {self.port}")
     
-    def get_state(self):
-        """Get current state"""
+    def _state_changed(self):
+        """Record a state mutation and wake the event loop for waiting clients"""
+        with self._state_lock:
+            self._state_version += 1
+        self._wake()
+    
+    def _wake(self):
+        """Interrupt the event loop's select() from any thread"""
+        try:
+            os.write(self._wake_w, b'\0')
+        except (BlockingIOError, OSError):
+            pass  # Pipe already full (a wake-up is pending) or closed
+    
+    def _call_on_loop(self, func):
+        """Have the event loop run func, so it can touch state the loop reads"""
+        self._loop_calls.put(func)
+        self._wake()
+    
+    def _build_catalog(self):
+        """Category list, per-category character lists and catalog summary from the file index"""
         categories = self.file_manager.get_categories()
-        characters = []
-        
-        if categories and self.current_category < len(categories):
-            category_id = categories[self.current_category]['id']
-            characters = self.file_manager.get_characters(category_id)
+        characters = [self.file_manager.get_characters(cat['id']) for cat in categories]
+        catalog = [
+            {'id': cat['id'], 'name': cat['name'], 'count': cat['count']}
+            for cat in categories
+        ]
+        return categories, characters, catalog
+    
+    def _rescan(self):
+        """Rescan the Amiibo folders (NFC worker) and hand the new catalog to the event loop"""
+        self.file_manager.refresh_index()
+        catalog = self._build_catalog()
+        self._call_on_loop(lambda: self._publish_catalog(*catalog))
+    
+    def _publish_catalog(self, categories, characters, catalog):
+        """Swap in a rebuilt catalog; runs on the event loop"""
+        self._categories, self._characters, self._catalog = categories, characters, catalog
         
+        # Keep the selection in range of the new lists
+        if self.current_category >= len(self._categories):
+            self.current_category = 0
+        if self.current_character >= len(self._current_characters()):
+            self.current_character = 0
+        self._catalog_version += 1
+        self._state_changed()
+    
+    def _current_characters(self):
+        """Cached character list of the selected category"""
+        if 0 <= self.current_category < len(self._characters):
+            return self._characters[self.current_category]
+        return []
+    
+    def get_live_state(self):
+        """Get the small, frequently changing part of the state"""
         return {
             'status': self.status,
-            'categories': categories,
             'current_category': self.current_category,
-            'characters': characters,
             'current_character': self.current_character,
             'current_amiibo': self.current_amiibo.get('character', None) if self.current_amiibo else None,
-            'write_progress': self.write_progress
+            'write_progress': self.write_progress,
+            'tag_present': self._last_tag_uid is not None,
+            'version': self._state_version,
+            'catalog_version': self._catalog_version
         }
     
+    def get_catalog(self):
+        """Get the category list without per-file details"""
+        return {'categories': self._catalog, 'catalog_version': self._catalog_version}
+    
+    def get_category_characters(self, index, fields=None):
+        """Get characters for a category index, optionally trimmed to some fields"""
+        if not 0 <= index < len(self._characters):
+            return []
+        
+        characters = self._characters[index]
+        if fields:
+            return [{key: char.get(key) for key in fields} for char in characters]
+        return characters
+    
+    def get_state(self):
+        """Get current state (live fields plus full category/character lists)"""
+        state = self.get_live_state()
+        state['categories'] = self._categories
+        state['characters'] = self.get_category_characters(self.current_category)
+        return state
+    
     def handle_command(self, command):
         """Handle command from client"""
         cmd = command.get('cmd')
@@ -65,51 +215,59 @@ class AmiiboServer:
         if cmd == 'get_state':
             return {'success': True, 'data': self.get_state()}
         
+        elif cmd == 'get_state_delta':
+            return {'success': True, 'data': self.get_live_state()}
+        
+        elif cmd == 'get_catalog':
+            return {'success': True, 'data': self.get_catalog()}
+        
+        elif cmd == 'get_characters':
+            index = command.get('index', self.current_category)
+            characters = self.get_category_characters(index, command.get('fields'))
+            return {'success': True, 'index': index, 'data': characters}
+        
         elif cmd == 'set_category':
             index = command.get('index', 0)
-            categories = self.file_manager.get_categories()
-            if 0 <= index < len(categories):
+            if 0 <= index < len(self._categories):
                 self.current_category = index
                 self.current_character = 0  # Reset character selection
-            return {'success': True, 'data': self.get_state()}
+                self._state_changed()
+            return {'success': True, 'data': self.get_live_state()}
         
         elif cmd == 'set_character':
             index = command.get('index', 0)
-            categories = self.file_manager.get_categories()
-            if categories:
-                category_id = categories[self.current_category]['id']
-                characters = self.file_manager.get_characters(category_id)
-                if 0 <= index < len(characters):
-                    self.current_character = index
-            return {'success': True, 'data': self.get_state()}
+            if 0 <= index < len(self._current_characters()):
+                self.current_character = index
+                self._state_changed()
+            return {'success': True, 'data': self.get_live_state()}
         
         elif cmd == 'select_character':
             index = command.get('index', self.current_character)
             self.current_character = index
             self._load_character()
-            return {'success': True, 'data': self.get_state()}
+            self._state_changed()
+            return {'success': True, 'data': self.get_live_state()}
         
         elif cmd == 'write_tag':
-            success = self._write_tag()
-            return {'success': success, 'data': self.get_state()}
+            # Runs on the NFC worker; progress and result arrive via status/write_progress
+            job_id = self._submit_nfc_job(self._write_tag)
+            return {'success': True, 'job_id': job_id, 'data': self.get_live_state()}
         
         elif cmd == 'detect_tag':
-            uid = self.nfc_writer.nfc_writer.detect_tag()
-            detected = uid is not None and len(uid) > 0
-            return {'success': True, 'detected': detected}
+            # Answered from the worker's last poll - no I2C traffic here
+            return {'success': True, 'detected': self._last_tag_uid is not None}
+        
+        elif cmd == 'rescan':
+            # Off the event loop; catalog_version moves when it is done
+            job_id = self._submit_nfc_job(self._rescan)
+            return {'success': True, 'job_id': job_id, 'data': self.get_live_state()}
         
         else:
             return {'success': False, 'error': 'Unknown command'}
     
     def _load_character(self):
         """Load selected character"""
-        categories = self.file_manager.get_categories()
-        if not categories:
-            return False
-        
-        category_id = categories[self.current_category]['id']
-        characters = self.file_manager.get_characters(category_id)
-        
+        characters = self._current_characters()
         if not characters or self.current_character >= len(characters):
             return False
         
@@ -131,56 +289,235 @@ class AmiiboServer:
         
         self.status = "writing"
         self.write_progress = 0
+        self._state_changed()
         
         def progress_callback(progress):
             self.write_progress = progress
+            self._state_changed()
         
         try:
             success = self.nfc_writer.write_to_tag(progress_callback)
             self.status = "write_complete" if success else "write_error"
+            self._state_changed()
             time.sleep(2)
             self.status = "idle"
+            self._state_changed()
             return success
         except Exception as e:
             print(f"Write error: {e}")
             self.status = "write_error"
+            self._state_changed()
             time.sleep(2)
             self.status = "idle"
+            self._state_changed()
             return False
     
-    def handle_client(self, client_socket, address):
-        """Handle client connection"""
-        print(f"Client connected: {address}")
+    def _submit_nfc_job(self, func):
+        """Queue a job for the NFC worker thread and return its id"""
+        with self._state_lock:
+            self._job_id += 1
+            job_id = self._job_id
+        self._nfc_queue.put(func)
+        return job_id
+    
+    def _nfc_worker(self):
+        """Run queued NFC jobs; poll for a tag whenever the queue is idle"""
+        # Own core and a higher priority keep I2C timing steady while clients are served
+        _pin_current_thread({self.NFC_CPU})
+        try:
+            os.nice(self.NFC_NICE)
+        except (AttributeError, OSError):
+            pass
         
+        while self.running:
+            try:
+                job = self._nfc_queue.get(timeout=self.DETECT_INTERVAL)
+            except queue.Empty:
+                job = None
+            
+            try:
+                if job:
+                    job()
+                else:
+                    uid = self.nfc_writer.nfc_writer.detect_tag(verbose=False)
+                    uid = uid or None
+                    if uid != self._last_tag_uid:
+                        self._last_tag_uid = uid
+                        self._state_changed()
+            except Exception as e:
+                print(f"NFC worker error: {e}")
+    
+    def _accept(self, key, mask):
+        """Accept pending connections and register them for reading"""
+        while True:
+            try:
+                client_socket, address = self.server_socket.accept()
+            except (BlockingIOError, OSError):
+                return
+            client_socket.setblocking(False)
+            conn = _Connection(client_socket, address)
+            self._connections.add(conn)
+            self._selector.register(client_socket, selectors.EVENT_READ, conn)
+            print(f"Client connected: {address}")
+    
+    def _close(self, conn):
+        """Unregister and close a client connection"""
+        if conn not in self._connections:
+            return
+        self._connections.discard(conn)
         try:
-            while self.running:
-                # Receive command
-                data = client_socket.recv(4096)
-                if not data:
+            self._selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        conn.sock.close()
+        print(f"Client disconnected: {conn.address}")
+    
+    def _send(self, conn, data):
+        """Send now if possible; queue the rest until the socket is writable"""
+        if conn not in self._connections:
+            return
+        if not conn.wbuf:
+            try:
+                sent = conn.sock.send(data)
+            except BlockingIOError:
+                sent = 0
+            except OSError:
+                self._close(conn)
+                return
+            if sent == len(data):
+                return
+            data = data[sent:]
+            self._selector.modify(conn.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, conn)
+        conn.wbuf += data
+    
+    def _flush(self, conn):
+        """Write queued output once the socket is writable"""
+        try:
+            sent = conn.sock.send(conn.wbuf)
+        except BlockingIOError:
+            return
+        except OSError:
+            self._close(conn)
+            return
+        del conn.wbuf[:sent]
+        if not conn.wbuf:
+            self._selector.modify(conn.sock, selectors.EVENT_READ, conn)
+    
+    def _on_readable(self, conn):
+        """Read what arrived and handle every complete message"""
+        if conn.rlen == len(conn.rbuf):
+            if conn.rlen >= self.MAX_MESSAGE_SIZE:
+                self._send(conn, encode_message({'success': False, 'error': 'Message too large'}))
+                self._close(conn)
+                return
+            conn.rbuf.extend(bytes(conn.rlen))
+        
+        try:
+            n = conn.sock.recv_into(memoryview(conn.rbuf)[conn.rlen:])
+        except BlockingIOError:
+            return
+        except OSError as e:
+            print(f"Client error: {e}")
+            n = 0
+        if not n:
+            self._close(conn)
+            return
+        conn.rlen += n
+        self._process_input(conn)
+    
+    def _process_input(self, conn):
+        """Dispatch buffered newline-delimited messages until one has to wait"""
+        start = 0
+        while not conn.waiting and not conn.subscribed:
+            idx = conn.rbuf.find(b'\n', start, conn.rlen)
+            if idx < 0:
+                if not start and self.ACCEPT_UNTERMINATED and self._is_whole_message(conn):
+                    idx = conn.rlen
+                else:
                     break
-                
-                try:
-                    command = json.loads(data.decode('utf-8'))
-                    response = self.handle_command(command)
-                    response_data = json.dumps(response).encode('utf-8')
-                    
-                    # Send response with newline delimiter
-                    client_socket.sendall(response_data + b'\n')
-                    
-                except json.JSONDecodeError:
-                    error_response = {'success': False, 'error': 'Invalid JSON'}
-                    response_data = json.dumps(error_response).encode('utf-8')
-                    client_socket.sendall(response_data + b'\n')
-                except Exception as e:
-                    error_response = {'success': False, 'error': str(e)}
-                    response_data = json.dumps(error_response).encode('utf-8')
-                    client_socket.sendall(response_data + b'\n')
+            if idx > start:
+                self._dispatch(conn, bytes(conn.rbuf[start:idx]))
+            start = idx + 1
         
+        # Keep the unfinished tail at the front of the buffer
+        if start:
+            start = min(start, conn.rlen)
+            conn.rlen -= start
+            conn.rbuf[:conn.rlen] = conn.rbuf[start:start + conn.rlen]
+    
+    def _is_whole_message(self, conn):
+        """True if the buffer is one complete JSON message with no newline (older clients)"""
+        # Cheap check first; a newline-framed message split after an inner '}' won't parse
+        if not conn.rlen or conn.rbuf[conn.rlen - 1] != 0x7D:  # '}'
+            return False
+        try:
+            _json_decoder.decode(conn.rbuf[:conn.rlen].decode('utf-8'))
+        except ValueError:  # Also covers JSONDecodeError and UnicodeDecodeError
+            return False
+        return True
+    
+    def _dispatch(self, conn, data):
+        """Handle one message; long-polls and subscriptions are answered later"""
+        try:
+            command = _json_decoder.decode(data.decode('utf-8'))
+            cmd = command.get('cmd')
+            if cmd == 'subscribe':
+                # Connection becomes push-only until the client goes away
+                conn.subscribed = True
+                conn.since = command.get('since')
+                conn.deadline = time.monotonic()
+            elif cmd == 'wait_for_change':
+                # Long-poll: hold the request until the version moves past 'since'
+                conn.waiting = True
+                conn.since = command.get('since')
+                conn.deadline = time.monotonic() + min(float(command.get('timeout', 25)), 60)
+            else:
+                self._send(conn, encode_message(self.handle_command(command)))
+        except json.JSONDecodeError:
+            self._send(conn, encode_message({'success': False, 'error': 'Invalid JSON'}))
         except Exception as e:
-            print(f"Client error: {e}")
-        finally:
-            client_socket.close()
-            print(f"Client disconnected: {address}")
+            self._send(conn, encode_message({'success': False, 'error': str(e)}))
+    
+    def _service_waiters(self):
+        """Answer long-polls and push to subscribers whose version is stale; return next deadline"""
+        now = time.monotonic()
+        version = self._state_version
+        next_deadline = None
+        
+        for conn in list(self._connections):
+            if not (conn.waiting or conn.subscribed):
+                continue
+            if conn.since != version or now >= conn.deadline:
+                state = self.get_live_state()
+                message = encode_message({'success': True, 'data': state})
+                if conn.subscribed:
+                    # Timeout doubles as a heartbeat so clients can spot a dead server
+                    conn.since = state['version']
+                    conn.deadline = now + self.HEARTBEAT_INTERVAL
+                    self._send(conn, PUSH_HEADER % conn.since + message)
+                else:
+                    conn.waiting = False
+                    self._send(conn, message)
+                    self._process_input(conn)
+            if conn.waiting or conn.subscribed:
+                if next_deadline is None or conn.deadline < next_deadline:
+                    next_deadline = conn.deadline
+        return next_deadline
+    
+    def _drain_wake(self, key, mask):
+        """Empty the wake-up pipe and run queued calls; waiters are serviced after every select()"""
+        try:
+            while os.read(self._wake_r, 512):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        
+        while True:
+            try:
+                func = self._loop_calls.get_nowait()
+            except queue.Empty:
+                break
+            func()
     
     def start(self):
         """Start server"""
@@ -189,34 +526,61 @@ class AmiiboServer:
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.server_socket.bind(('0.0.0.0', self.port))
         self.server_socket.listen(5)
+        self.server_socket.setblocking(False)
         
         print(f"✓ Server listening on port {self.port}")
         print("Waiting for client connections...")
         
+        self._nfc_thread = threading.Thread(target=self._nfc_worker, name='nfc-worker', daemon=True)
+        self._nfc_thread.start()
+        
+        # The event loop stays off the NFC core
+        if hasattr(os, 'sched_getaffinity'):
+            _pin_current_thread(os.sched_getaffinity(0) - {self.NFC_CPU})
+        
+        # Callables mark the listening socket and wake pipe; _Connection marks clients
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.server_socket, selectors.EVENT_READ, self._accept)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, self._drain_wake)
+        
         try:
+            next_deadline = None
             while self.running:
-                client_socket, address = self.server_socket.accept()
-                client_thread = threading.Thread(
-                    target=self.handle_client,
-                    args=(client_socket, address)
-                )
-                client_thread.daemon = True
-                client_thread.start()
+                timeout = 1.0 if next_deadline is None else max(0, min(1.0, next_deadline - time.monotonic()))
+                for key, mask in self._selector.select(timeout):
+                    if isinstance(key.data, _Connection):
+                        if mask & selectors.EVENT_WRITE:
+                            self._flush(key.data)
+                        if mask & selectors.EVENT_READ:
+                            self._on_readable(key.data)
+                    else:
+                        key.data(key, mask)
+                next_deadline = self._service_waiters()
         except KeyboardInterrupt:
             print("\nShutting down...")
         finally:
+            for conn in list(self._connections):
+                self._close(conn)
+            self._selector.close()
             self.stop()
     
     def stop(self):
         """Stop server"""
         self.running = False
+        self._wake()
         if self.server_socket:
             self.server_socket.close()
+        if self._nfc_thread:
+            # Let the current job or poll finish before releasing the bus
+            self._nfc_thread.join(timeout=5)
         self.nfc_writer.cleanup()
+        close_bus(1)
         GPIO.cleanup()
         print("Server stopped")
 
 def main():
+    logging.basicConfig(level=DebugConfig.LOG_LEVEL, format='%(levelname)s %(name)s: %(message)s')
+    
     print("=" * 60)
     print("Headless Amiibo Server")
     print("=" * 60)
@@ -3,18 +3,62 @@
 Continuous NFC Tag Detection
 
 Continuously polls for tags - easier to test placement.
+The PN532 hunts for tags on its own (InAutoPoll) and only answers when it
+finds one; run with --irq if its IRQ line is wired to skip status polling.
 """
 
+import os
 import time
 import smbus2
 import sys
+import RPi.GPIO as GPIO
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from amiibo_emulator.src.config_rpi import (
+    PN532_FRAME_FIRMWARE, PN532_FRAME_SAM, PN532_FRAME_AUTOPOLL, HardwareConfig,
+    PN532_T_I2C, PN532_NACK_RETRIES,
+)
+from amiibo_emulator.src.i2c_bus import get_bus, close_bus
+
+ACK_FRAME = b'\x00\x00\xff\x00\xff\x00'
+
+
+def parse_autopoll_uid(response):
+    """Extract the first target's UID from an InAutoPoll reply, or None.
+    
+    After D5 61 the reply is: NbTg, Type, DataLength, then the target data
+    (Tg, SENS_RES(2), SEL_RES, NFCIDLength, NFCID...).
+    """
+    i = response.find(b'\xD5\x61')
+    if i < 0 or i + 10 > len(response) or response[i + 2] < 1:
+        return None
+    
+    uid_len = response[i + 9]
+    uid = response[i + 10:i + 10 + uid_len]
+    if not 4 <= uid_len <= 10 or len(uid) != uid_len:
+        return None
+    if not uid.strip(b'\x00') or not uid.strip(b'\x80'):
+        return None
+    return uid
 
 class ContinuousDetector:
     """Continuous tag detector"""
     
-    def __init__(self):
-        self.i2c = smbus2.SMBus(1)
+    POLL_TIMEOUT = 1.0  # Seconds without a reply before reporting no tag
+    
+    def __init__(self, irq_pin=None):
+        self.i2c, self.lock = get_bus(1)
         self.address = 0x24
+        self.polling = False  # An InAutoPoll is running on the PN532
+        self.failures = 0  # Bus errors that survived every retry
+        
+        # The PN532 pulls IRQ low when a response is waiting
+        self.irq_pin = irq_pin
+        if irq_pin is not None:
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setup(irq_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
         
         print("Initializing PN532...")
         self._init_pn532()
@@ -24,14 +68,7 @@ class ContinuousDetector:
     def _init_pn532(self):
         """Initialize PN532"""
         # Get firmware version
-        cmd = [0x00, 0x00, 0xFF, 0x02, 0xFE, 0xD4, 0x02, 0x2A, 0x00]
-        msg = smbus2.i2c_msg.write(self.address, cmd)
-        self.i2c.i2c_rdwr(msg)
-        time.sleep(0.05)
-        
-        msg = smbus2.i2c_msg.read(self.address, 20)
-        self.i2c.i2c_rdwr(msg)
-        response = list(msg)
+        response = self._exchange(PN532_FRAME_FIRMWARE, 20, 0.05)
         
         if len(response) > 10:
             if response[0] == 0x01:
@@ -43,57 +80,80 @@ class ContinuousDetector:
             print(f"  Firmware: v{ver}.{rev}")
         
         # Configure SAM
-        cmd = [0x00, 0x00, 0xFF, 0x04, 0xFC, 0xD4, 0x14, 0x01, 0x14, 0x01, 0x02, 0x00]
-        msg = smbus2.i2c_msg.write(self.address, cmd)
-        self.i2c.i2c_rdwr(msg)
-        time.sleep(0.05)
+        self._exchange(PN532_FRAME_SAM, 20, 0.05)
+    
+    def _rdwr(self, *msgs):
+        """i2c_rdwr under the bus lock, retrying NACKs after the 5 ms t_I2C"""
+        for attempt in range(1, PN532_NACK_RETRIES + 1):
+            try:
+                with self.lock:
+                    self.i2c.i2c_rdwr(*msgs)
+                return
+            except OSError:
+                if attempt == PN532_NACK_RETRIES:
+                    self.failures += 1
+                    raise
+                time.sleep(PN532_T_I2C)
+    
+    def _exchange(self, frame, read_len, delay):
+        """Write a command frame, wait, and read the reply - holding the bus throughout"""
+        with self.lock:
+            self._rdwr(smbus2.i2c_msg.write(self.address, frame))
+            time.sleep(delay)
+            msg = smbus2.i2c_msg.read(self.address, read_len)
+            self._rdwr(msg)
+        return bytes(msg)
+    
+    def _wait_ready(self, timeout):
+        """Wait until the PN532 has a frame for us; False on timeout"""
+        if self.irq_pin is not None:
+            if GPIO.input(self.irq_pin) == GPIO.LOW:
+                return True
+            # wait_for_edge rejects a 0 ms timeout, which is what <1 ms left rounds to
+            return GPIO.wait_for_edge(self.irq_pin, GPIO.FALLING, timeout=max(1, int(timeout * 1000))) is not None
         
-        msg = smbus2.i2c_msg.read(self.address, 20)
-        self.i2c.i2c_rdwr(msg)
+        # No IRQ line: poll the status byte (a 1-byte read, not a new command)
+        deadline = time.monotonic() + timeout
+        while True:
+            msg = smbus2.i2c_msg.read(self.address, 1)
+            self._rdwr(msg)
+            if bytes(msg)[0] == 0x01:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
     
-    def detect_once(self):
-        """Try to detect a tag once"""
+    def detect_once(self, timeout=POLL_TIMEOUT):
+        """Wait up to timeout for a tag; returns its UID or None"""
         try:
-            # InListPassiveTarget command
-            cmd = [0x00, 0x00, 0xFF, 0x04, 0xFC, 0xD4, 0x4A, 0x01, 0x00, 0xE1, 0x00]
-            msg = smbus2.i2c_msg.write(self.address, cmd)
-            self.i2c.i2c_rdwr(msg)
-            
-            time.sleep(0.15)  # Wait for tag detection
-            
-            msg = smbus2.i2c_msg.read(self.address, 64)
-            self.i2c.i2c_rdwr(msg)
-            response = list(msg)
+            if not self.polling:
+                self._rdwr(smbus2.i2c_msg.write(self.address, PN532_FRAME_AUTOPOLL))
+                self.polling = True
             
-            # Skip ready byte
-            if response[0] == 0x01:
-                response = response[1:]
+            # First frame is the ACK; the target report follows once a tag is seen
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._wait_ready(remaining):
+                    return None
+                msg = smbus2.i2c_msg.read(self.address, 64)
+                self._rdwr(msg)
+                response = bytes(msg)
+                if response[1:7] != ACK_FRAME:
+                    break
             
-            # Check if we got a valid response with tag data
-            # Look for the response pattern
-            if len(response) > 15:
-                # Find number of tags
-                for i in range(min(12, len(response))):
-                    if response[i] == 0x01:  # 1 tag found
-                        # Try to extract UID
-                        try:
-                            # UID length is usually 5-7 bytes after some offset
-                            for offset in range(i, min(i+10, len(response))):
-                                uid_len = response[offset]
-                                if 4 <= uid_len <= 10:
-                                    uid_start = offset + 1
-                                    if uid_start + uid_len <= len(response):
-                                        uid = bytes(response[uid_start:uid_start+uid_len])
-                                        # Verify it's not all zeros or all 0x80
-                                        if uid != b'\x00' * len(uid) and uid != b'\x80' * len(uid):
-                                            return uid
-                        except:
-                            pass
-            
-            return None
+            # A target report ends the autopoll; the next call starts a new one
+            self.polling = False
+            return parse_autopoll_uid(response)
             
         except Exception as e:
-            print(f"Error: {e}")
+            print(f"Error: {e} ({self.failures} bus failures so far)")
+            self.polling = False
+            # Reconfigure SAM so a wedged PN532 recovers without restarting the script
+            try:
+                self._exchange(PN532_FRAME_SAM, 20, 0.05)
+            except OSError:
+                pass
             return None
     
     def run(self):
@@ -125,22 +185,24 @@ class ContinuousDetector:
                         no_tag_count = 0
                     sys.stdout.write(".")
                     sys.stdout.flush()
+                    # The tag would be reported again at once; recheck in 300ms
+                    time.sleep(0.3)
                 else:
+                    # detect_once already waited POLL_TIMEOUT for the PN532
                     if last_uid is not None:
                         print("\n✗ Tag removed")
                         last_uid = None
                     no_tag_count += 1
-                    if no_tag_count % 10 == 0:
+                    if no_tag_count % 3 == 0:
                         sys.stdout.write(".")
                         sys.stdout.flush()
                 
-                time.sleep(0.3)  # Check every 300ms
-                
         except KeyboardInterrupt:
             print("\n\nExiting...")
         finally:
-            self.i2c.close()
+            close_bus(1)
 
 if __name__ == "__main__":
-    detector = ContinuousDetector()
+    irq_pin = HardwareConfig.PN532_IRQ_PIN if '--irq' in sys.argv else None
+    detector = ContinuousDetector(irq_pin)
     detector.run()
@@ -3,10 +3,26 @@
 Simple NFC Tag Reader
 
 Reads and displays information from NTAG215 tags.
+Run with --irq <BCM pin> if the PN532 IRQ line is wired to wait on it
+instead of polling the status byte over I2C.
 """
 
+import os
+import sys
 import time
+import struct
 import smbus2
+import RPi.GPIO as GPIO
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from amiibo_emulator.src.i2c_bus import get_bus, close_bus
+
+_FIRMWARE = struct.Struct('4B')  # IC, Ver, Rev, Support
+
+# Maps non-printable bytes to '.' for the ASCII column of the dump
+_PRINT_TABLE = bytes(b if 32 <= b < 127 else 0x2E for b in range(256))
 
 class SimpleNFCReader:
     """Simple PN532 reader for NTAG215 tags"""
@@ -16,11 +32,29 @@ class SimpleNFCReader:
     CMD_INLISTPASSIVETARGET = 0x4A
     CMD_INDATAEXCHANGE = 0x40
     NTAG_CMD_READ = 0x30
+    NTAG_CMD_FAST_READ = 0x3A
+    
+    ACK_FRAME = [0x00, 0x00, 0xFF, 0x00, 0xFF, 0x00]
+    FRAME_FIRMWARE = bytes([0x00, 0x00, 0xFF, 0x02, 0xFE, 0xD4, 0x02, 0x2A, 0x00])
     
-    def __init__(self, i2c_bus=1):
-        self.i2c = smbus2.SMBus(i2c_bus)
+    def __init__(self, i2c_bus=1, irq_pin=None):
+        # Shared per process, so later readers reuse the open bus; the lock
+        # is held for each whole command/ACK/reply exchange
+        self.i2c_bus = i2c_bus
+        self.i2c, self.lock = get_bus(i2c_bus)
         self.address = 0x24
         
+        # These commands never change, so build their frames once
+        self._frame_sam = self._build_command(self.CMD_SAMCONFIGURATION, b'\x01\x14\x01')
+        self._frame_list = self._build_command(self.CMD_INLISTPASSIVETARGET, b'\x01\x00')
+        self._frame_read = {}  # READ frames by page
+        
+        # The PN532 pulls IRQ low while a response is waiting
+        self.irq_pin = irq_pin
+        if irq_pin is not None:
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setup(irq_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        
         print("Initializing PN532...")
         version = self.get_firmware_version()
         if version:
@@ -33,19 +67,12 @@ class SimpleNFCReader:
     def get_firmware_version(self):
         """Get firmware version"""
         try:
-            cmd = [0x00, 0x00, 0xFF, 0x02, 0xFE, 0xD4, 0x02, 0x2A, 0x00]
-            msg = smbus2.i2c_msg.write(self.address, cmd)
-            self.i2c.i2c_rdwr(msg)
-            time.sleep(0.05)
+            # Framing + IC, Ver, Rev, Support
+            response = self._exchange(self.FRAME_FIRMWARE, 14).tobytes()
             
-            msg = smbus2.i2c_msg.read(self.address, 20)
-            self.i2c.i2c_rdwr(msg)
-            response = list(msg)
-            
-            if len(response) > 12 and response[0] == 0x01:
-                return (response[9], response[10], response[11], response[12])
-            elif len(response) > 12:
-                return (response[8], response[9], response[10], response[11])
+            i = response.find(b'\xD5\x03')
+            if i >= 0 and i + 6 <= len(response):
+                return _FIRMWARE.unpack_from(response, i + 2)
             return None
         except Exception as e:
             print(f"Error: {e}")
@@ -53,42 +80,67 @@ class SimpleNFCReader:
     
     def _configure_sam(self):
         """Configure SAM"""
-        cmd = self._build_command(self.CMD_SAMCONFIGURATION, [0x01, 0x14, 0x01])
-        self._send_command(cmd)
-        time.sleep(0.05)
-        self._read_response()
+        self._exchange(self._frame_sam, 10)
         print("✓ SAM configured")
     
-    def _build_command(self, cmd, data=None):
+    def _build_command(self, cmd, data=b''):
         """Build PN532 command frame"""
-        if data is None:
-            data = []
-        
-        length = len(data) + 1
-        lcs = (~length + 1) & 0xFF
-        
-        frame = [0x00, 0x00, 0xFF, length, lcs, 0xD4, cmd]
-        frame.extend(data)
-        
-        dcs = (~sum([0xD4, cmd] + data) + 1) & 0xFF
-        frame.append(dcs)
-        frame.append(0x00)
-        
-        return frame
+        body = bytes((0xD4, cmd)) + data
+        length = len(body)  # LEN covers TFI + command + data
+        lcs = (-length) & 0xFF
+        dcs = (-sum(body)) & 0xFF
+        return b'\x00\x00\xFF' + bytes((length, lcs)) + body + bytes((dcs, 0x00))
     
     def _send_command(self, cmd):
-        """Send command"""
-        time.sleep(0.01)
+        """Send command; the reads that follow wait until the PN532 is ready"""
         msg = smbus2.i2c_msg.write(self.address, cmd)
         self.i2c.i2c_rdwr(msg)
-        time.sleep(0.01)
     
-    def _read_response(self, length=64):
-        """Read response"""
-        time.sleep(0.05)
+    def _exchange(self, cmd, length, timeout=0.1):
+        """Send a command and read its reply, holding the bus throughout"""
+        with self.lock:
+            self._send_command(cmd)
+            return self._read_response(length, timeout)
+    
+    def _wait_irq(self, timeout=0.1):
+        """Wait for the IRQ line to go low (response ready); False on timeout"""
+        if GPIO.input(self.irq_pin) == GPIO.LOW:
+            return True
+        return GPIO.wait_for_edge(self.irq_pin, GPIO.FALLING, timeout=int(timeout * 1000)) is not None
+    
+    def _wait_ready(self, timeout=0.1, interval=0.001):
+        """Wait until the PN532 has a frame ready (IRQ line or status byte); False on timeout"""
+        if self.irq_pin is not None:
+            return self._wait_irq(timeout)
+        
+        deadline = time.monotonic() + timeout
+        while True:
+            msg = smbus2.i2c_msg.read(self.address, 1)
+            self.i2c.i2c_rdwr(msg)
+            if list(msg)[0] == 0x01:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)  # Don't hammer the bus
+    
+    def _read_ack(self, timeout=0.1):
+        """Read the ACK the PN532 sends before every reply (status byte + 6 bytes)"""
+        self._wait_ready(timeout)
+        msg = smbus2.i2c_msg.read(self.address, 7)
+        self.i2c.i2c_rdwr(msg)
+        return list(msg)[1:7] == self.ACK_FRAME
+    
+    def _read_response(self, length=64, timeout=0.1):
+        """Read a reply of at most length bytes (including status byte and framing) after its ACK"""
+        if not self._read_ack():
+            return memoryview(b'')
+        
+        # On timeout read anyway - callers reject whatever is there
+        self._wait_ready(timeout)
         msg = smbus2.i2c_msg.read(self.address, length)
         self.i2c.i2c_rdwr(msg)
-        response = list(msg)
+        # A view, so dropping the status byte and slicing out data don't copy
+        response = memoryview(bytes(msg))
         if response[0] == 0x01:
             response = response[1:]
         return response
@@ -96,49 +148,53 @@ class SimpleNFCReader:
     def detect_tag(self):
         """Detect tag and return UID"""
         print("\nDetecting tag...")
-        cmd = self._build_command(self.CMD_INLISTPASSIVETARGET, [0x01, 0x00])
-        self._send_command(cmd)
-        time.sleep(0.2)
-        response = self._read_response()
+        # Listening for a passive target is the one slow step
+        # Framing + NbTg, Tg, SENS_RES, SEL_RES, NFCIDLength and up to 10 UID bytes
+        response = self._exchange(self._frame_list, 26, timeout=0.3)
         
         if not response:
             print("✗ No response from PN532")
             return None
         
-        print(f"Response: {bytes(response[:30]).hex()}")
-        
-        # Try to find UID in response
-        for offset in range(min(15, len(response))):
-            if response[offset] > 0 and response[offset] < 5:
-                try:
-                    uid_offset = offset + 5
-                    if uid_offset < len(response):
-                        uid_length = response[uid_offset]
-                        if 4 <= uid_length <= 10:
-                            uid = bytes(response[uid_offset+1:uid_offset+1+uid_length])
-                            if len(uid) == uid_length:
-                                return uid
-                except:
-                    continue
+        print(f"Response: {response[:30].hex()}")
+        
+        # After D5 4B: NbTg, Tg, SENS_RES(2), SEL_RES, NFCIDLength, NFCID...
+        response = bytes(response)
+        i = response.find(b'\xD5\x4B')
+        if i >= 0 and i + 8 <= len(response) and response[i + 2] == 0x01:
+            uid_length = response[i + 7]
+            uid = response[i + 8:i + 8 + uid_length]
+            if 4 <= uid_length <= 10 and len(uid) == uid_length:
+                return uid
         
         print("✗ No tag detected")
         return None
     
     def read_page(self, page_num):
         """Read a page (4 bytes) from tag"""
-        cmd_data = [0x01, self.NTAG_CMD_READ, page_num]
+        cmd = self._frame_read.get(page_num)
+        if cmd is None:
+            cmd_data = bytes((0x01, self.NTAG_CMD_READ, page_num))
+            cmd = self._frame_read[page_num] = self._build_command(self.CMD_INDATAEXCHANGE, cmd_data)
+        response = self._exchange(cmd, 27)  # Framing + status + 16 bytes
+        return self._exchange_data(response, 16)  # 16 bytes (4 pages)
+    
+    def fast_read(self, start, end):
+        """Read pages start..end (inclusive) in one FAST_READ exchange"""
+        size = (end - start + 1) * 4
+        cmd_data = bytes((0x01, self.NTAG_CMD_FAST_READ, start, end))
         cmd = self._build_command(self.CMD_INDATAEXCHANGE, cmd_data)
-        self._send_command(cmd)
-        time.sleep(0.05)
-        response = self._read_response()
-        
-        # Extract data from response
-        if response and len(response) > 10:
-            # Data starts after header
-            for i in range(len(response) - 16):
-                if response[i] == 0xD5 and response[i+1] == 0x41 and response[i+2] == 0x00:
-                    return bytes(response[i+3:i+19])  # 16 bytes (4 pages)
-        return None
+        # Status + preamble/LEN/LCS + D5 41 00 + data + DCS/postamble
+        response = self._exchange(cmd, size + 11)
+        return self._exchange_data(response, size)
+    
+    def _exchange_data(self, response, size):
+        """View of the size bytes after the D5 41 00 (InDataExchange OK) header, or None"""
+        buf = response.obj  # The bytes behind the view, so find() can search it
+        i = buf.find(b'\xD5\x41\x00')
+        if i < 0 or i + 3 + size > len(buf):
+            return None
+        return memoryview(buf)[i + 3:i + 3 + size]
     
     def read_tag_info(self):
         """Read and display tag information"""
@@ -150,30 +206,36 @@ class SimpleNFCReader:
         print(f"  UID: {uid.hex().upper()}")
         print(f"  UID Length: {len(uid)} bytes")
         
-        # Read first few pages
+        # Pages 0-21 cover the header and the amiibo ID in a single exchange
         print("\nReading tag data...")
         print("=" * 60)
         
-        for page in range(0, 20):  # Read first 20 pages
-            data = self.read_page(page)
-            if data:
-                # Show 4 pages at a time (16 bytes)
-                for i in range(4):
-                    page_num = page + i
-                    offset = i * 4
-                    page_data = data[offset:offset+4]
-                    hex_str = ' '.join(f'{b:02X}' for b in page_data)
-                    ascii_str = ''.join(chr(b) if 32 <= b < 127 else '.' for b in page_data)
-                    print(f"Page {page_num:3d}: {hex_str}  {ascii_str}")
-                break  # Only need one read for 4 pages
-            else:
-                print(f"Page {page:3d}: Failed to read")
-                break
+        data = self.fast_read(0, 21)
+        if data:
+            # Page 21 holds the character and game ID
+            amiibo_data = data[84:88]
+            out = self._format_pages(data)
+            out += [
+                "=" * 60,
+                "",
+                "Amiibo Info:",
+                f"  Character ID: {amiibo_data[0:2].hex().upper()}",
+                f"  Game ID: {amiibo_data[2:4].hex().upper()}",
+            ]
+            sys.stdout.write('\n'.join(out) + '\n')
+            return True
+        
+        # Tag rejected FAST_READ - fall back to 4-page READs
+        data = self.read_page(0)
+        if data:
+            # Show 4 pages at a time (16 bytes)
+            sys.stdout.write('\n'.join(self._format_pages(data)) + '\n')
+        else:
+            print("Page   0: Failed to read")
         
         print("=" * 60)
         
-        # Check if it looks like an Amiibo
-        data = self.read_page(0)
+        # Check if it looks like an Amiibo, reusing the page 0 read above
         if data:
             # Check for Amiibo signature (pages 21-22 contain game/character ID)
             amiibo_data = self.read_page(21)
@@ -186,9 +248,23 @@ class SimpleNFCReader:
         
         return True
     
+    def _format_pages(self, data, first_page=0):
+        """Format data as hex + ASCII dump lines, one 4-byte page per line"""
+        text = data.tobytes().translate(_PRINT_TABLE).decode('ascii')
+        # Slicing the memoryview doesn't copy
+        return [f"Page {first_page + i // 4:3d}: {data[i:i+4].hex(' ').upper()}  {text[i:i+4]}"
+                for i in range(0, len(data), 4)]
+    
     def cleanup(self):
-        """Cleanup"""
-        self.i2c.close()
+        """Cleanup (the shared bus stays open for its other users)"""
+        if self.irq_pin is not None:
+            GPIO.cleanup(self.irq_pin)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.cleanup()
 
 def main():
     print("=" * 60)
@@ -196,20 +272,23 @@ def main():
     print("=" * 60)
     print()
     
+    irq_pin = None
+    if '--irq' in sys.argv:
+        irq_pin = int(sys.argv[sys.argv.index('--irq') + 1])
+    
     try:
-        reader = SimpleNFCReader()
-        
-        print("\nPlace your NTAG215 tag on the PN532 reader...")
-        print("Press Ctrl+C to exit")
-        print()
-        
-        while True:
-            if reader.read_tag_info():
-                print("\n✓ Read complete!")
-                break
-            else:
-                print("\nNo tag detected. Place tag on reader and press Enter...")
-                input()
+        with SimpleNFCReader(irq_pin=irq_pin) as reader:
+            print("\nPlace your NTAG215 tag on the PN532 reader...")
+            print("Press Ctrl+C to exit")
+            print()
+            
+            while True:
+                if reader.read_tag_info():
+                    print("\n✓ Read complete!")
+                    break
+                else:
+                    print("\nNo tag detected. Place tag on reader and press Enter...")
+                    input()
         
     except KeyboardInterrupt:
         print("\n\nExiting...")
@@ -218,10 +297,7 @@ def main():
         import traceback
         traceback.print_exc()
     finally:
-        try:
-            reader.cleanup()
-        except:
-            pass
+        close_bus(1)
 
 if __name__ == "__main__":
     main()
@@ -28,9 +28,12 @@ def main():
     
     # Delete old index if it exists
     index_file = "amiibo_data/index.json"
-    if os.path.exists(index_file):
-        print(f"Removing old index file: {index_file}")
+    try:
         os.remove(index_file)
+    except FileNotFoundError:
+        pass
+    else:
+        print(f"Removed old index file: {index_file}")
         print("✓ Old index removed")
         print()
     
@@ -40,23 +43,28 @@ def main():
     
     # Display statistics
     stats = fm.get_statistics()
-    print()
-    print("=" * 50)
-    print("Index Regeneration Complete!")
-    print("=" * 50)
-    print(f"Total Files: {stats['total_files']}")
-    print(f"Total Categories: {stats['total_categories']}")
-    print(f"Special Editions: {stats['special_editions']}")
-    print()
-    print("Top 5 Categories:")
+    out = [
+        "",
+        "=" * 50,
+        "Index Regeneration Complete!",
+        "=" * 50,
+        f"Total Files: {stats['total_files']}",
+        f"Total Categories: {stats['total_categories']}",
+        f"Special Editions: {stats['special_editions']}",
+        "",
+        "Top 5 Categories:",
+    ]
     for i, (category, count) in enumerate(stats['most_popular_categories'], 1):
-        print(f"  {i}. {category}: {count} files")
-    print()
-    print("✓ Index saved to:", index_file)
-    print()
-    print("You can now run the main application:")
-    print("  sudo python3 main_rpi.py")
-    print()
+        out.append(f"  {i}. {category}: {count} files")
+    out += [
+        "",
+        f"✓ Index saved to: {index_file}",
+        "",
+        "You can now run the main application:",
+        "  sudo python3 main_rpi.py",
+        "",
+    ]
+    sys.stdout.write('\n'.join(out) + '\n')
     
     return 0
 